@@ -5,19 +5,33 @@
 # @project: GPOP - Genetic Population
 
 import numpy as np
-from scipy.integrate import odeint
-import matplotlib.pyplot as plt
 import argparse
+from gpop import crossing_times, clone_population, progress
 
-parser = argparse.ArgumentParser(description='This program simulate the evolution of a the allele frequency in a population of 3 alleles')
-parser.add_argument('-s1', '--s', type=float, default=1, help='affinity to the allele A')
-parser.add_argument('-s2', '--s2', type=float, default=2, help='affinity to the allele B')
-parser.add_argument('-s3', '--s3', type=float, default=3, help='affinity to the allele C')
-args = parser.parse_args() # parse the arguments
-
-s = args.s
-s1 = args.s2
-s2 = args.s3
+def get_parser() -> argparse.ArgumentParser:
+    '''
+    Get the parser of the arguments of the program
+    '''
+    parser = argparse.ArgumentParser(description='This program simulate the evolution of a the allele frequency in a population of 3 alleles')
+    parser.add_argument('-s1', '--s', type=float, default=1, help='affinity to the allele A')
+    parser.add_argument('-s2', '--s2', type=float, default=2, help='affinity to the allele B')
+    parser.add_argument('-s3', '--s3', type=float, default=3, help='affinity to the allele C')
+    parser.add_argument('-coefficients', '--coefficients', type=str, default=None, help='text file of the selection coefficients of K alleles (replaces s1, s2, s3)')
+    parser.add_argument('-interaction', '--interaction', type=str, default=None, help='text file of the K x K interaction matrix (by default A[i,j] = s_j for j != i and 0 on the diagonal)')
+    parser.add_argument('-method', '--method', type=str, default='LSODA', help='stiff solver of the K-allele system (LSODA, BDF or Radau)')
+    parser.add_argument('-stochastic', '--stochastic', action='store_true', help='simulate a finite population with new beneficial clones (Wright-Fisher) instead of the deterministic system')
+    parser.add_argument('-size', '--size', type=int, default=10**6, help='size of the population of the stochastic simulation')
+    parser.add_argument('-gen', '--gen', type=int, default=10000, help='number of generations of the stochastic simulation')
+    parser.add_argument('-U', '--U', type=float, default=1e-6, help='beneficial mutation rate per individual and generation')
+    parser.add_argument('-sb', '--sb', type=float, default=0.01, help='mean selection coefficient of the new clones (exponential distribution)')
+    parser.add_argument('-record', '--record', type=int, default=10, help='number of generations between two records of the clone counts')
+    parser.add_argument('-seed', '--seed', type=int, default=None, help='seed of the random generator of the stochastic simulation')
+    parser.add_argument('-progress', '--progress', type=float, default=1.0, help='seconds between two progress reports of the stochastic simulation (0 to disable them)')
+    parser.add_argument('-thresholds', '--thresholds', type=float, nargs='+', default=None, help='frequencies of the allele whose crossing times are returned instead of the figure')
+    parser.add_argument('-allele', '--allele', type=int, default=0, help='index of the allele of the thresholds (0 for A, 1 for B, 2 for C)')
+    parser.add_argument('-stop', '--stop', action='store_true', help='stop the integration at the crossing of the last threshold')
+    parser.add_argument('-no_plot', '--no_plot', '--no-plot', action='store_true', help='do not draw nor save the figure')
+    return parser
 
 
 def Z3pop(Z, t, param) : # The function associated with the system
@@ -30,15 +44,146 @@ def Z3pop(Z, t, param) : # The function associated with the system
     ]
     return res
 
-def main():
+def ZKpop(x, t, param) : # The function associated with the system of K alleles, for the frequencies x = Z/z
+    # With dZ_i = Z_i (s_i + (A Z)_i / z), the frequencies follow dx_i = x_i (r_i - x.r) with r = s + A x
+    s, A = param
+    r = s + (s @ x - s*x if A is None else A @ x) # growth rate of each allele, by default A[i,j] = s_j for j != i
+    return x*(r - x @ r)
+
+def ZKjac(x, t, param) : # The analytic Jacobian of ZKpop
+    # d(x.r)/dx_k = r_k + (A^T x)_k, so J = diag(r - x.r) + x (A - (r + A^T x))
+    s, A = param
+    if A is None:
+        A = s[None,:] - np.diag(s)
+    r = s + A @ x
+    J = x[:,None] * (A - (r + x @ A)[None,:])
+    J[np.diag_indices_from(J)] += r - x @ r
+    return J
+
+def main_stochastic(args) :
+    '''
+    Simulate clonal interference in a finite population and plot the frequency of the main clones and the mean fitness
+    -----------------
+    parameter
+    args: argparse.Namespace -> the arguments of the program
+    '''
+    pop = clone_population(args.size, args.U, args.sb, args.record, np.random.default_rng(args.seed))
+    with progress(args.gen, "Generations", args.progress) as bar:
+        pop.run(args.gen, bar)
+
+    trajectories = pop.get_trajectories()
+    log_mean_fitness = pop.get_log_mean_fitness()
+    print(f"Rate of adaptation: {pop.get_rate_of_adaptation():.3g} per generation, {pop.get_nb_clones()} clones arose, {pop.get_nb_alive()} are alive")
+    np.savez(f"clonal_interference_stochastic_{args.size}_{args.U}_{args.sb}_{args.gen}.npz", log_mean_fitness=log_mean_fitness, **trajectories)
+    if args.no_plot:
+        return
+
+    import matplotlib.pyplot as plt
+
+    rows = np.repeat(np.arange(len(trajectories['indptr'])-1), np.diff(trajectories['indptr'])) #record of each count
+    frequencies = trajectories['counts'] / args.size
+    plt.subplot(2, 1, 1)
+    for k in np.unique(trajectories['clones'][frequencies >= 0.05]): #clones reaching 5%
+        trajectory = np.zeros(len(trajectories['generations']))
+        trajectory[rows[trajectories['clones'] == k]] = frequencies[trajectories['clones'] == k]
+        plt.plot(trajectories['generations'], trajectory, alpha = 0.8)
+    plt.title(f"Clonal interference in a population of {args.size} individuals, U = {args.U}, sb = {args.sb}")
+    plt.ylabel("Clone frequency")
+    plt.grid()
+    plt.subplot(2, 1, 2)
+    plt.plot(log_mean_fitness)
+    plt.xlabel("Generation")
+    plt.ylabel("Log mean fitness")
+    plt.grid()
+
+    plt.savefig(f"clonal_interference_stochastic_{args.size}_{args.U}_{args.sb}_{args.gen}.png")
+    plt.show()
+
+def main_K(args, t) :
+    '''
+    Integrate the system of K alleles whose coefficients are read from files, with a stiff solver and the analytic Jacobian
+    -----------------
+    parameters
+    args: argparse.Namespace -> the arguments of the program
+    t: np.ndarray -> the time points of the solution
+    '''
+    s_K = np.atleast_1d(np.loadtxt(args.coefficients)) # Selection coefficients of the K alleles
+    A = None if args.interaction is None else np.loadtxt(args.interaction, ndmin=2) # Interaction matrix
+    K = len(s_K)
+    x0 = np.full(K, 1/K) # Initial frequencies, the alleles start with the same frequency
+    param = (s_K, A)
+
+    if args.thresholds is not None:
+        result = crossing_times(ZKpop, x0, max(t), param, args.allele, args.thresholds, args.stop, args.method, ZKjac)
+        for threshold, time in zip(args.thresholds, result['times']):
+            print(f"The frequency of the allele {args.allele} crosses {threshold} at the time {time*100:g}")
+        top = np.argsort(result['y'])[::-1][:3]
+        print(f"At the time {result['t']*100:g}: " + ",    ".join(f"Allele {k}: {round(result['y'][k],3)}" for k in top) + f" ({result['nfev']} evaluations of the system)")
+        return
+
+    from scipy.integrate import solve_ivp #scipy is only imported by the deterministic systems
+    solution = solve_ivp(lambda t, x: ZKpop(x, t, param), (t[0], t[-1]), x0, method=args.method, t_eval=t,
+                         jac=lambda t, x: ZKjac(x, t, param), rtol=1e-8, atol=1e-10)
+    y = solution.y.T
+    y = y/np.sum(y, axis=1)[:,None] # Normalization of the solution
+
+    top = np.argsort(y[-1])[::-1][:3] # Alleles with the largest final frequencies
+    if args.no_plot:
+        print(f"At the time {t[-1]*100:g}: " + ",    ".join(f"Allele {k}: {round(y[-1,k],3)}" for k in top))
+        return
+
+    import matplotlib.pyplot as plt
+    for k in range(K):
+        plt.plot(t*100, y[:,k], label = f"Allele {k}" if K <= 10 else None, alpha = 0.8)
+    plt.title(f"Evolution of the allele frequencies in a population of {K} alleles\n" + ",    ".join(f"Allele {k}: {round(y[-1,k],3)}" for k in top))
+    plt.xlabel("Time")
+    plt.ylabel("Allele frequency")
+    plt.axis([0,max(t)*100,0,1])
+    plt.grid()
+    if K <= 10:
+        plt.legend()
+
+    plt.savefig(f"clonal_interference_infinite_{K}_alleles.png")
+    plt.show()
+
+def main(argv : list = None):
+    '''
+    Integrate the system (or simulate the finite population) and plot the frequencies of the alleles
+    -----------------
+    parameter
+    argv: list -> the arguments of the program (those of the command line if None)
+    '''
+    args = get_parser().parse_args(argv) # parse the arguments
+    if args.stochastic:
+        main_stochastic(args)
+        return
+
     t = np.arange(0.0,10.0,0.001) # Time interval and time step for the integration of the system of ODEs
+    if args.coefficients is not None:
+        main_K(args, t)
+        return
+
+    s, s1, s2 = args.s, args.s2, args.s3
+
     y0 = [1.0,1.0,1.0] # Initial values of the system
 
     param = [s, s1, s2] # Parameters of the system
 
+    if args.thresholds is not None:
+        result = crossing_times(Z3pop, y0, max(t), param, args.allele, args.thresholds, args.stop)
+        for threshold, time in zip(args.thresholds, result['times']):
+            print(f"The frequency of the allele {'ABC'[args.allele]} crosses {threshold} at the time {time*100:g}")
+        print(f"At the time {result['t']*100:g}: Allele A: {round(result['y'][0],3)},    Allele B: {round(result['y'][1],3)},    Allele C: {round(result['y'][2],3)} ({result['nfev']} evaluations of the system)")
+        return
+
+    from scipy.integrate import odeint #scipy is only imported by the deterministic systems
     y = odeint(Z3pop, y0, t, args=(param,)) # Integration of the system of ODEs
     y = y/np.sum(y, axis=1)[:,None] # Normalization of the solution
+    if args.no_plot:
+        print(f"At the time {t[-1]*100:g}: Allele A: {round(y[-1,0],3)},    Allele B: {round(y[-1,1],3)},    Allele C: {round(y[-1,2],3)}")
+        return
 
+    import matplotlib.pyplot as plt
     plt.plot(t*100,y[:,0], label = "Allele A", alpha = 0.8)
     plt.plot(t*100,y[:,1], label = "Allele B", alpha = 0.8)
     plt.plot(t*100,y[:,2], label = "Allele C", alpha = 0.8)
@@ -5,181 +5,350 @@
 # @project: GPOP - Genetic Population
 
 import random
+import numpy as np
 import argparse
+from gpop import genealogy_population
+
+def get_parser() -> argparse.ArgumentParser:
+    '''
+    Get the parser of the arguments of the program
+    '''
+    parser = argparse.ArgumentParser(description='Simulate population genetics and retrieve the coalescent event time and last common ancestor')
+    parser.add_argument('-size', '--size', type=int, default=100, help='Size of the population')
+    parser.add_argument('-sim', '--sim', type=int, default=10, help='Number of simulations')
+    parser.add_argument('-max_iter', '--max_iter', default=1000, type=int, help='Maximum number of iterations')
+    parser.add_argument('-groups', '--groups', type=int, default=10, help='Number of random groups whose last coalescent event is retrieved')
+    parser.add_argument('-simplify', '--simplify', type=int, default=1000, help='Number of generations between two simplifications of the genealogy (0 for never)')
+    parser.add_argument('-export', '--export', type=str, default=None, help='Path of a .npz file where the simplified genealogy is saved')
+    parser.add_argument('-backward', '--backward', action='store_true', help='Simulate the genealogy of a sample backward in time instead of the whole population forward')
+    parser.add_argument('-sample', '--sample', type=int, default=10, help='Number of lineages of the sample in backward mode')
+    parser.add_argument('-exact', '--exact', action='store_true', help='Draw the exact discrete Wright-Fisher mergers instead of the Kingman coalescent in backward mode')
+    return parser
+
+def export_genealogy(pop : genealogy_population, path : str):
+    '''
+    Simplify the genealogy of a population and save it as a table of nodes and a table of edges in a .npz file
+    -----------------
+    parameters
+    pop: genealogy_population -> the population
+    path: str -> the path of the .npz file
+    '''
+    pop.simplify()
+    child = np.flatnonzero(pop.tree_parent != -1)
+    np.savez(path, node_time=pop.tree_time, node_index=pop.tree_index, edge_parent=pop.tree_parent[child], edge_child=child, samples=pop.tree_samples, generation=pop.get_generation())
+
+def last_coalescent_event(pop : genealogy_population, group : list) -> dict:
+    '''
+    Find the common ancestor of a group of individuals if it exists, by walking the table of parents back in time
+    -----------------
+    parameters
+    pop: genealogy_population -> the population
+    group: list -> the indices of the individuals of the group
+    -----------------
+    output
+    individual: dict -> the index of the common ancestor of the group and the number of generations since it if it exists, None otherwise
+    '''
+    lineages = np.unique(group) #distinct lineages of the group
+    if len(lineages) == 1: #a single individual is its own common ancestor
+        return {'ancestor' : int(lineages[0]), 'generation' : 0}
+    for g in reversed(range(pop.base, pop.get_generation())): #for each generation of the table in reverse order
+        lineages = np.unique(pop.get_parents(g+1)[lineages]) #distinct ancestors of the group at the generation g
+        if len(lineages) == 1: #all the individuals of the group have the same ancestor at the generation g
+            return {'ancestor' : int(lineages[0]), 'generation' : pop.get_generation() - g}
+
+    #the older coalescent events are in the simplified tree
+    index = lca_index(pop.tree_parent, pop.tree_time, pop.tree_index)
+    ancestor = index.query([pop.tree_samples[lineages]])[0]
+    if ancestor == -1:
+        return {'ancestor' : None, 'generation' : None}
+    return {'ancestor' : int(index.index[ancestor]), 'generation' : int(pop.get_generation() - index.time[ancestor])}
+
+def all_identical_by_descent(pop : genealogy_population) -> bool:
+    '''
+    Check if all the individuals of the population are identical by descent, i.e. if they all descend from the same founder
+    -----------------
+    parameter
+    pop: genealogy_population -> the population
+    -----------------
+    output
+    bool: bool -> True if all the individuals are identical by descent, False otherwise
+    '''
+    return pop.is_absorbed()
+
+def get_subpopulation(pop : genealogy_population, group : list) -> np.ndarray:
+    '''
+    Get the subpopulation of a group of individuals
+    -----------------
+    parameters
+    pop: genealogy_population -> the population
+    group: list -> the group of individuals
+    -----------------
+    output
+    subpopulation: np.ndarray -> the indices of the individuals of the group
+    '''
+    return pop.get_population()[np.asarray(group)]
+
+def get_subpopulation_ancestors(pop : genealogy_population, group : list) -> np.ndarray:
+    '''
+    Get the ancestors of the subpopulation of a group of individuals
+    -----------------
+    parameters
+    pop: genealogy_population -> the population
+    group: list -> the group of individuals
+    -----------------
+    output
+    ancestors: np.ndarray -> the ancestors of the subpopulation of the group, one row for each individual
+    '''
+    return pop.get_ancestors(get_subpopulation(pop, group))
 
-parser = argparse.ArgumentParser(description='Simulate population genetics and retrieve the coalescent event time and last common ancestor')
-parser.add_argument('-size', '--size', type=int, default=100, help='Size of the population')
-parser.add_argument('-sim', '--sim', type=int, default=10, help='Number of simulations')
-parser.add_argument('-max_iter', '--max_iter', default=1000, type=int, help='Maximum number of iterations')
-args = parser.parse_args() # parse the arguments
 
-size = args.size
-simu = args.sim
-max_iter = args.max_iter
+def get_subpopulation_ancestors_last_coalescent_event(pop : genealogy_population, group : list) -> dict:
+    '''
+    Get the last coalescent event of the ancestors of the subpopulation of a group of individuals
+    -----------------
+    parameters
+    pop: genealogy_population -> the population
+    group: list -> the group of individuals
+    -----------------
+    output
+    event: dict -> the last coalescent event of the ancestors of the subpopulation of the group
+    '''
+    return last_coalescent_event(pop, get_subpopulation(pop, group))
 
-class population():
+class lca_index():
     '''
-    This class is used to create a population of individuals
+    This class is used to find the lowest common ancestors of many groups of nodes of a genealogy at once.
+    It stores the ancestor 2^j steps above each node (binary lifting), so a group of k nodes costs O(k log(depth)).
     '''
-    def __init__(self, size : int):
+    def __init__(self, parent : np.ndarray, time : np.ndarray, index : np.ndarray):
         '''
-        This function initialize the parameters of the population from generation 0
+        This function builds the index of a genealogy
         ----------------
         parameters
-        size: int -> the size of the population
-        ----------------
-        output
-        self.size: int -> the size of the population
-        self.generation: int -> the number of the generation
-        self.population: list -> the list of the individuals of the population
+        parent: np.ndarray -> the parent node of each node (-1 for a root)
+        time: np.ndarray -> the generation of each node
+        index: np.ndarray -> the index of each node in its generation
         '''
-        self.size = size #size of the population
-        self.generation = 0 #number of the generation
-        self.population = [] #list of the individuals of the population
-        self.population = [self.get_individual() for i in range(self.size)] #create the population
+        self.time = time #generation of each node
+        self.index = index #index of each node in its generation
+        nodes = np.arange(len(parent))
+        ancestor = np.where(parent == -1, nodes, parent) #the parent of a root is itself
+        self.depth = (parent != -1).astype(np.int64) #number of steps between each node and its root
+        self.up = [ancestor] #ancestor 2^j steps above each node, a root stays on itself
+        while True: #pointer jumping: double the steps until every node reaches its root
+            self.depth += self.depth[ancestor]
+            ancestor = ancestor[ancestor]
+            if np.array_equal(ancestor, self.up[-1]):
+                break
+            self.up.append(ancestor)
 
-    class individual():
+    def lca(self, u : np.ndarray, v : np.ndarray) -> np.ndarray:
         '''
-        This class is used to create individuals.
+        Find the lowest common ancestors of pairs of nodes
+        -----------------
+        parameters
+        u, v: np.ndarray -> the nodes of each pair (-1 for no node)
+        -----------------
+        output
+        ancestor: np.ndarray -> the lowest common ancestor of each pair, -1 if they have none
         '''
-        def __init__(self):
-            '''
-            This function initialize the parameters of the individual
-            ------------------------------------
-            parameter
-            self: the individual
-            ------------------------------------
-            output
-            self.ancestors: list of the ancestors of the individual
-            '''            
-            self.ancestors = [] #list of the ancestors of the individual
-
-    def get_individual(self) -> individual: #get an individual
-        return self.individual()
-   
-    #create new generation from the last one
-    def next_generation(self):
+        missing = (u == -1) | (v == -1)
+        u, v = np.where(missing, 0, u), np.where(missing, 0, v)
+        deeper = self.depth[u] < self.depth[v]
+        u, v = np.where(deeper, v, u), np.where(deeper, u, v) #u is the deepest node of each pair
+        difference = self.depth[u] - self.depth[v]
+        for j, up in enumerate(self.up): #lift u to the depth of v
+            u = np.where((difference >> j) & 1, up[u], u)
+        for up in reversed(self.up): #lift both nodes while their ancestors differ
+            different = up[u] != up[v]
+            u, v = np.where(different, up[u], u), np.where(different, up[v], v)
+        ancestor = np.where(u == v, u, self.up[0][u])
+        return np.where(missing | ((u != v) & (self.up[0][u] != self.up[0][v])), -1, ancestor)
+
+    def query(self, groups : list) -> np.ndarray:
         '''
-        This function create the next generation from the last one
+        Find the lowest common ancestor of each group of nodes
+        -----------------
+        parameter
+        groups: list -> the groups of nodes, of any sizes
+        -----------------
+        output
+        ancestor: np.ndarray -> the lowest common ancestor of each group, -1 if it has none
         '''
-        ids = [random.randint(0,self.size-1) for i in range(self.size)] #create the new population
-        old_pop = self.population.copy() #copy the old population
-
-        self.population = [] #create the new population
-        for i in ids: # for each individual in the new population
-            self.population.append(self.individual()) #create the new population
-            self.population[-1].ancestors = old_pop[i].ancestors + [i] #add the ancestors of the individual
-        
-        self.generation += 1 #add 1 to the generation number
-
-    def get_generation(self) -> int: #get the generation number
-        return self.generation
-    
-    def get_population(self) -> list: #get the population list
-        return self.population
+        width = max(len(group) for group in groups)
+        members = np.array([list(group) + [group[0]] * (width - len(group)) for group in groups]) #groups padded with their first node
+        ancestor = members[:, 0]
+        for k in range(1, width):
+            ancestor = self.lca(ancestor, members[:, k])
+        return ancestor
 
-    def get_ancestors(self) -> list: #get the ancestors list
-        return [i.ancestors for i in self.population]
-
-def last_coalescent_event(group : list) -> dict:
+def genealogy_index(pop : genealogy_population) -> tuple:
     '''
-    Find the common ancestor of a group of individuals if it exists
+    Build the index of the lowest common ancestors of the whole genealogy of a population (see genealogy_population.get_genealogy)
     -----------------
     parameter
-    group: list of individuals -> the group of individuals
+    pop: genealogy_population -> the population
     -----------------
     output
-    individual: dict -> the common ancestor of the group if it exists, None otherwise 
+    index: lca_index -> the index of the genealogy
+    samples: np.ndarray -> the node of each individual of the current generation
     '''
-    for i in reversed(range(len(group[0].ancestors))): #for each generation in the ancestors of the first individual of the group in reverse order
-        #if all the individuals of the group have the same ancestor at the generation i 
-        if all([(group[j].ancestors)[i] == group[0].ancestors[i] for j in range(len(group))]):            
-            return {'ancestor' : group[0].ancestors[i], 'generation' : len(group[0].ancestors) - i}
-    return {'ancestor' : None, 'generation' : None}
+    genealogy = pop.get_genealogy()
+    return lca_index(genealogy['parent'], genealogy['time'], genealogy['index']), genealogy['samples']
 
-def all_identical_by_descent(pop : population) -> bool:
+def last_coalescent_events(pop : genealogy_population, groups : list, index : tuple = None) -> dict:
     '''
-    Check if all the individuals of the population are identical by descent
+    Find the common ancestor of many groups of individuals at once
     -----------------
-    parameter
-    pop: population -> the population
+    parameters
+    pop: genealogy_population -> the population
+    groups: list -> the groups of individuals, each one a list of indices in the current generation
+    index: tuple -> the index of the genealogy of the population and the nodes of the individuals, as returned by genealogy_index (built if None)
     -----------------
     output
-    bool: bool -> True if all the individuals are identical by descent, False otherwise
+    events: dict -> 'ancestor': the index of the common ancestor of each group in its generation
+                    'generation': the number of generations since the common ancestor of each group
+                    both are -1 for the groups without common ancestor
     '''
-    for k in range(len(pop.get_population()[0].ancestors)):
-        # si tous les individus ont le même ancêtre à la génération k alors ils sont identiques par descendance
-        if all([pop.get_population()[j].ancestors[k] == pop.get_population()[0].ancestors[k] for j in range(len(pop.get_population()))]):
-            return True
+    index, samples = genealogy_index(pop) if index is None else index
+    ancestor = index.query([samples[np.asarray(group)] for group in groups])
+    found = ancestor != -1
+    return {'ancestor' : np.where(found, index.index[ancestor], -1), 'generation' : np.where(found, pop.get_generation() - index.time[ancestor], -1)}
 
-def get_subpopulation(pop : population, group : list) -> list:
+def kingman_coalescent(n : int, size : int, rng : np.random.Generator = None) -> dict:
     '''
-    Get the subpopulation of a group of individuals
+    Simulate the genealogy of a sample of n lineages backward in time with the Kingman coalescent.
+    While there are k lineages, the waiting time before the next merger is exponential with rate k(k-1)/2 (in units of size generations)
+    and the two lineages that merge are drawn uniformly.
     -----------------
     parameters
-    pop: population -> the population
-    group: list -> the group of individuals
+    n: int -> the number of lineages of the sample
+    size: int -> the size of the population
+    rng: np.random.Generator -> the random generator (a new one if None)
     -----------------
     output
-    subpopulation: list -> the subpopulation of the group
+    tree: dict -> 'parent': the parent node of each node (-1 for the root), the leaves are the nodes 0 to n-1
+                  'time': the number of generations between the sample and each node
+                  'branch_length': the number of generations between each node and its parent
+                  'tmrca': the number of generations between the sample and its most recent common ancestor
     '''
-    subpopulation = []
-    for i in group:
-        subpopulation.append(pop.get_population()[i])
-    return subpopulation
+    rng = np.random.default_rng() if rng is None else rng
+    k = np.arange(n, 1, -1) #number of lineages before each merger
+    time = np.zeros(2*n-1)
+    time[n:] = np.cumsum(rng.exponential(2 / (k*(k-1)))) * size #time of each merger
+    parent = np.full(2*n-1, -1)
+
+    first, second = rng.random(n-1), rng.random(n-1) #uniform draws of the two lineages that merge
+    lineages = list(range(n)) #node of each lineage
+    for m in range(n-1):
+        nb = n - m #number of lineages
+        i, j = int(first[m] * nb), int(second[m] * (nb-1))
+        j += j >= i #two distinct lineages
+        parent[lineages[i]] = parent[lineages[j]] = n + m
+        lineages[i] = n + m #the new node replaces the first lineage
+        lineages[j] = lineages[-1] #and the last lineage replaces the second one
+        lineages.pop()
 
-def get_subpopulation_ancestors(pop : population, group : list) -> list:
+    return {'parent' : parent, 'time' : time, 'branch_length' : tree_branch_lengths(parent, time), 'tmrca' : time[-1]}
+
+def wright_fisher_coalescent(n : int, size : int, rng : np.random.Generator = None) -> dict:
     '''
-    Get the ancestors of the subpopulation of a group of individuals
+    Simulate the genealogy of a sample of n lineages backward in time with the exact discrete Wright-Fisher model.
+    The generations without merger are skipped with a geometric draw. In a generation with at least one merger,
+    the first lineage that picks an already picked parent is drawn, the lineages before it pick distinct parents
+    and the lineages after it pick any parent, so several lineages can merge at the same generation.
     -----------------
     parameters
-    pop: population -> the population
-    group: list -> the group of individuals
+    n: int -> the number of lineages of the sample
+    size: int -> the size of the population
+    rng: np.random.Generator -> the random generator (a new one if None)
     -----------------
     output
-    ancestors: list -> the ancestors of the subpopulation of the group
+    tree: dict -> same as kingman_coalescent, the nodes can have more than two children
     '''
-    return [i.ancestors for i in get_subpopulation(pop, group)]
+    rng = np.random.default_rng() if rng is None else rng
+    parent, time = np.full(2*n-1, -1), np.zeros(2*n-1) #each merger removes at least one lineage, so there are at most 2n-1 nodes
+    nb_nodes = n
+    lineages = np.arange(n) #node of each lineage
+    generation = 0
+    while len(lineages) > 1:
+        k = len(lineages)
+        j = np.arange(1, min(k, size+1))
+        log_distinct = np.concatenate(([0], np.cumsum(np.log1p(-j[:-1] / size)))) #log probability that the j first lineages pick distinct parents
+        first_collision = np.cumsum(np.exp(log_distinct) * j / size) #probability that the first lineage picking an already picked parent is at most the j-th
+        p_merger = first_collision[-1] #probability of at least one merger in a generation
+        generation += rng.geometric(min(p_merger, 1.0))
+
+        c = j[min(np.searchsorted(first_collision, rng.random() * p_merger), len(j)-1)] #first lineage picking an already picked parent
+        parents = np.empty(k, dtype=np.int64)
+        parents[:c] = rng.choice(size, c, replace=False)
+        parents[c] = parents[rng.integers(0, c)]
+        parents[c+1:] = rng.integers(0, size, k-c-1)
+
+        distinct, inverse, counts = np.unique(parents, return_inverse=True, return_counts=True)
+        merged = counts > 1 #parents of several lineages
+        nodes = np.full(len(distinct), -1)
+        nodes[merged] = nb_nodes + np.arange(np.count_nonzero(merged)) #a new node for each merger
+        nb_nodes += np.count_nonzero(merged)
+        time[nodes[merged]] = generation
 
+        merging = merged[inverse] #lineages that merge at this generation
+        parent[lineages[merging]] = nodes[inverse[merging]]
+        nodes[~merged] = lineages[~merging][np.argsort(inverse[~merging])] #the other lineages keep their node
+        lineages = nodes
 
-def get_subpopulation_ancestors_last_coalescent_event(pop : population, group : list) -> int:
+    parent, time = parent[:nb_nodes], time[:nb_nodes]
+    return {'parent' : parent, 'time' : time, 'branch_length' : tree_branch_lengths(parent, time), 'tmrca' : time[nb_nodes-1]}
+
+def tree_branch_lengths(parent : np.ndarray, time : np.ndarray) -> np.ndarray:
     '''
-    Get the last coalescent event of the ancestors of the subpopulation of a group of individuals
+    Get the length of the branch between each node and its parent
     -----------------
     parameters
-    pop: population -> the population
-    group: list -> the group of individuals
+    parent: np.ndarray -> the parent node of each node (-1 for the root)
+    time: np.ndarray -> the time of each node
     -----------------
     output
-    event: int -> the last coalescent event of the ancestors of the subpopulation of the group
+    branch_length: np.ndarray -> the length of the branch above each node (0 for the root)
     '''
-    return last_coalescent_event(get_subpopulation(pop, group))
+    return np.where(parent == -1, 0, time[parent] - time)
 
-
-def main():
+def main(argv : list = None):
     '''
     This function is used to run the simulations
+    -----------------
+    parameter
+    argv: list -> the arguments of the program (those of the command line if None)
     '''
-    pop = population(size) #create the population
+    args = get_parser().parse_args(argv) # parse the arguments
+    size = args.size
+    max_iter = args.max_iter
+
+    if args.backward:
+        coalescent = wright_fisher_coalescent if args.exact else kingman_coalescent
+        tree = coalescent(args.sample, size)
+        print(f"The {args.sample} lineages have their most recent common ancestor {tree['tmrca']:g} generations ago")
+        print(f"Total length of the branches: {tree['branch_length'].sum():g} generations")
+        return
+
+    pop = genealogy_population(size, simplify_interval=args.simplify) #create the population
     
     pop.next_generation()
+    pop.step(max_iter) #create the next generations until all the individuals descend from a single founder
     
-    cpt = 0
-    while not all_identical_by_descent(pop) and cpt < max_iter:
-        pop.next_generation()
-        cpt += 1
-    
-    if cpt == max_iter:
+    if not all_identical_by_descent(pop):
         print("The maximum number of iterations has been reached")
     else:
-        descent = last_coalescent_event(pop.get_population())
+        print(f"All the individuals descend from the founder {pop.get_founders()[0]} since the generation {pop.get_generation()}")
+        descent = last_coalescent_event(pop, pop.get_population())
         print(f"They are all identical by decent at the generation {descent['generation']} with the ancestor {descent['ancestor']}")
 
-        simulations = 10
-        for sim in range(simulations):
-            group = [random.randint(0, pop.size-1) for i in range(random.randint(2,5))]
-            result = get_subpopulation_ancestors_last_coalescent_event(pop, group)
-            print(f"The last coalescent event of the group {group} is at the generation {result['generation']} with the ancestor {result['ancestor']}")
+        groups = [[random.randint(0, pop.size-1) for i in range(random.randint(2,5))] for sim in range(args.groups)]
+        results = last_coalescent_events(pop, groups)
+        for group, generation, ancestor in zip(groups, results['generation'], results['ancestor']):
+            print(f"The last coalescent event of the group {group} is at the generation {generation} with the ancestor {ancestor}")
 
+    if args.export is not None:
+        export_genealogy(pop, args.export)
 if __name__ == "__main__":
     main()
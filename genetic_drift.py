@@ -4,131 +4,325 @@
 # @author: bastien camillo
 # @project: GPOP - Genetic Population
 
-import random
-import matplotlib.pyplot as plt
+import numpy as np
 import argparse
-from alive_progress import alive_bar
-
-parser = argparse.ArgumentParser(description='Genetic drift simulation')
-parser.add_argument('-sim', '--sim', type=int, default=100, help='Number of simulations')
-parser.add_argument('-size', '--size', type=int, default=100, help='Size of the population')
-parser.add_argument('-gen', '--gen', type=int, default=1000, help='Number of generations')
-args = parser.parse_args() # parse the arguments
-
-class population():
-    '''
-    This class is used to create a population of individuals
-    '''
-    def __init__(self, size : int, p : float):
-        '''
-        This function initialize the parameters of the population from generation 0
-        ----------------
-        parameters
-        size: int -> the size of the population
-        p: float -> the probability of having the genotype A
-        '''
-        self.size = size #size of the population
-        self.p = p #probability of having the allele A
-        self.generation = 0 #number of the generation
-        self.fitness = 0 #fitness of the population
-        self.fitness_list = [] #list of the fitness of the population
-        self.population = [] #list of the individuals of the population
-        self.population = [self.get_individual() for i in range(self.size)] #create the population
-        self.fitness = self.get_fitness() #get the fitness of the population
-        self.fitness_list.append(self.fitness) #add the fitness to the fitness list
-
-    class individual():
-        '''
-        This class is used to create individuals. Each individual has a probability p to have the allele A
-        '''
-        def __init__(self, p : float):
-            '''
-            This function initialize the parameters of the individual
-            ------------------------------------
-            parameter
-            self: the individual
-            p: float -> probability of having the allele A
-            ------------------------------------
-            output
-            self.genotype: the genotype of the individual
-            '''
-            self.p = p #probability of having the allele A
-            self.genotype = 'A' if random.random() < self.p else 'B' #create the genotype of the individual with the probability p
-
-        def get_genotype(self): #get the genotype of the individual
-            return self.genotype
-
-    def get_individual(self) -> individual: #get an individual
-        return self.individual(self.p)
-
-    def get_genotypes(self) -> list: #get the genotypes of the population in a list
-        return [i.genotype for i in self.population] 
-    
-    def get_fitness(self) -> float: #get the fitness of the population
-        return self.get_genotypes().count('A') / self.size
-    
-    #create new generation from the last one
-    def next_generation(self):
-        '''
-        This function create the next generation from the last one
-        '''
-        self.population = [random.choice(self.population) for i in range(self.size)] #create the new population
-        self.fitness = self.get_fitness() #get the fitness of the population
-        self.fitness_list.append(self.fitness) #add the fitness to the fitness list
-        self.generation += 1 #add 1 to the generation number
-
-    def get_generation(self) -> int: #get the generation number
-        return self.generation
-    
-    def get_fitness_list(self) -> list: #get the fitness list
-        return self.fitness_list
-
-    def get_population(self) -> list: #get the population list
-        return self.population
-
-def main():
+from typing import TYPE_CHECKING
+if TYPE_CHECKING: #scipy is only imported when it is used
+    from scipy import sparse
+from gpop import genotype_population, count_population, ensemble_population, progress
+from gpop.render import RENDERS, plot_trajectories
+
+def get_parser() -> argparse.ArgumentParser:
     '''
-    Here we create a population of 100 individuals with a probability of p in range(0.1, 1, 0.1) to have the allele A.
-    We do 100 simulations for each probability p and we plot the fitness of the population for each probability p for 1000 generations.
+    Get the parser of the arguments of the program
+    '''
+    parser = argparse.ArgumentParser(description='Genetic drift simulation')
+    parser.add_argument('-sim', '--sim', type=int, default=100, help='Number of simulations')
+    parser.add_argument('-size', '--size', type=int, default=100, help='Size of the population')
+    parser.add_argument('-gen', '--gen', type=int, default=1000, help='Number of generations')
+    parser.add_argument('-ensemble', '--ensemble', action='store_true', help='Advance every (p, simulation) pair together as one array of counts')
+    parser.add_argument('-bins', '--bins', type=int, default=20, help='Number of bins of the fixation/loss time histograms')
+    parser.add_argument('-analytic', '--analytic', action='store_true', help='Compute the exact distribution instead of simulating the populations')
+    parser.add_argument('-max_matrix', '--max_matrix', type=int, default=2000, help='Largest size solved with the transition matrix, the diffusion approximation is used above')
+    parser.add_argument('-terms', '--terms', type=int, default=1000, help='Number of terms of the series of the diffusion approximation')
+    parser.add_argument('-rows', '--rows', type=int, default=1000, help='Maximum number of generations where the analytic distribution is kept, plotted and saved')
+    parser.add_argument('-engine', '--engine', choices=['count', 'individual'], default='count', help='Simulation engine: allele-A count (binomial) or genotype of each individual')
+    parser.add_argument('-no_plot', '--no_plot', '--no-plot', action='store_true', help='Do not draw nor save the figure')
+    parser.add_argument('-progress', '--progress', type=float, default=1.0, help='Seconds between two progress reports (0 to disable them)')
+    parser.add_argument('-render', '--render', choices=RENDERS, default='lines', help='Rendering of the trajectories: one line each, density histogram, quantile bands or one downsampled LineCollection')
+    return parser
+
+def pad_fitness_list(fitness_list : list, generations : int) -> np.ndarray:
+    '''
+    Pad the fitness list of an absorbed population with its final value
+    -----------------
+    parameters
+    fitness_list: list -> the fitness list of the population (one value or one row of values per generation)
+    generations: int -> the last generation of the padded fitness list
+    -----------------
+    output
+    fitness_list: np.ndarray -> the padded fitness list
+    '''
+    fitness_list = np.asarray(fitness_list)
+    return np.concatenate([fitness_list, np.repeat(fitness_list[-1:], generations + 1 - len(fitness_list), axis=0)])
+
+def absorption_statistics(absorption : np.ndarray, fixed : np.ndarray, bins : int = 20, quantiles : tuple = (0.05, 0.25, 0.5, 0.75, 0.95)) -> dict:
+    '''
+    Get the distribution of the fixation and loss times of a group of populations
+    -----------------
+    parameters
+    absorption: np.ndarray -> the generation of fixation or loss of each population, -1 if not absorbed
+    fixed: np.ndarray -> True for the populations where A is fixed
+    bins: int -> the number of bins of the histograms
+    quantiles: tuple -> the quantiles of the times
+    -----------------
+    output
+    statistics: dict -> for 'fixation' and 'loss': number, mean, quantiles and histogram of the times
+    '''
+    statistics = {'segregating' : int(np.sum(absorption == -1))}
+    for name, mask in (('fixation', fixed), ('loss', ~fixed)):
+        times = absorption[mask & (absorption != -1)]
+        statistics[name] = {
+            'number' : len(times),
+            'mean' : times.mean() if len(times) else np.nan,
+            'quantiles' : dict(zip(quantiles, np.quantile(times, quantiles) if len(times) else [np.nan]*len(quantiles))),
+            'histogram' : np.histogram(times, bins=bins) if len(times) else (np.zeros(bins, dtype=int), np.zeros(bins+1))
+        }
+    return statistics
+
+def transition_matrix(size : int, eps : float = 1e-15) -> 'sparse.csr_matrix':
+    '''
+    Build the Wright-Fisher transition matrix between the numbers of A of two generations
+    -----------------
+    parameters
+    size: int -> the size of the population
+    eps: float -> the probabilities of each tail of a binomial row below this value are dropped
+    -----------------
+    output
+    matrix: sparse.csr_matrix -> matrix[i, j] is the probability to go from i to j individuals with the allele A
+    '''
+    from scipy import sparse
+    from scipy.stats import binom
+    freqs = np.arange(size+1) / size #frequency of A of each state
+    low = binom.ppf(eps, size, freqs).astype(int) #first state of the band of each row
+    high = binom.isf(eps, size, freqs).astype(int) #last state of the band of each row
+    high = np.maximum(high, low) #the rows of the absorbing states only contain their state
+    widths = high - low + 1 #number of states in the band of each row
+    rows = np.repeat(np.arange(size+1), widths)
+    cols = np.arange(widths.sum()) - np.repeat(np.cumsum(widths) - widths, widths) + np.repeat(low, widths)
+    return sparse.csr_matrix((binom.pmf(cols, size, freqs[rows]), (rows, cols)), shape=(size+1, size+1))
+
+def get_saved_generations(generations : int, nb_rows : int) -> np.ndarray: #get at most nb_rows generations evenly spaced between 0 and generations
+    return np.unique(np.linspace(0, generations, min(nb_rows, generations+1)).astype(int))
+
+def matrix_solution(size : int, ps : list, generations : int, nb_rows : int = 1000) -> dict:
+    '''
+    Propagate the exact distribution of the number of A with the transition matrix
+    -----------------
+    parameters
+    size: int -> the size of the population
+    ps: list -> the probabilities of having the genotype A at generation 0
+    generations: int -> the number of generations
+    nb_rows: int -> the maximum number of generations where the distribution is kept
+    -----------------
+    output
+    solution: dict -> 'fixation' and 'loss': probability of fixation and loss of A by each generation, shape (generation, p)
+                      'distribution': probability of each frequency at the kept generations (float32), shape (row, p, frequency)
+                      'generations': the kept generations
+                      'frequencies': the frequencies of the distribution
+    '''
+    from scipy.stats import binom
+    matrix = transition_matrix(size).T.tocsr() #transposed to propagate column vectors
+    saved = get_saved_generations(generations, nb_rows)
+    fixation, loss = np.zeros((generations+1, len(ps))), np.zeros((generations+1, len(ps)))
+    distribution = np.zeros((len(saved), len(ps), size+1), dtype=np.float32)
+    current = binom.pmf(np.arange(size+1)[:,None], size, np.asarray(ps)[None,:]) #each individual has the allele A with the probability p, shape (frequency, p)
+    row = 0
+    for i in range(generations+1):
+        if i > 0:
+            current = matrix @ current
+        fixation[i], loss[i] = current[-1], current[0]
+        if row < len(saved) and saved[row] == i:
+            distribution[row] = current.T
+            row += 1
+    return {'fixation' : fixation, 'loss' : loss, 'distribution' : distribution, 'generations' : saved, 'frequencies' : np.arange(size+1) / size}
+
+def diffusion_solution(size : int, ps : list, generations : int, nb_terms : int = 1000, nb_bins : int = 100, nb_rows : int = 1000, tolerance : float = 1e-8) -> dict:
+    '''
+    Compute the distribution of the frequency of A with the diffusion approximation of Kimura (1955)
+    The series is truncated after nb_terms terms, so it is only used once the first omitted term has decayed below the
+    tolerance, i.e. from the generation 2N*ln(1/tolerance)/(nb_terms+1)(nb_terms+2). Before, the frequency is close to a
+    Gaussian of mean p and variance p(1-p)(1-(1-1/N)^t): its mass below 0 (above 1) is the probability of loss (fixation).
+    nb_terms is raised if needed so that this Gaussian is only used while t < N/100.
+    The bins of the distribution hold the integral of the density over the bin, not its value at the center.
+    -----------------
+    parameters
+    size: int -> the size of the population
+    ps: list -> the frequencies of A at generation 0
+    generations: int -> the number of generations
+    nb_terms: int -> the number of terms of the series
+    nb_bins: int -> the number of bins of the distribution of the frequency between 0 and 1
+    nb_rows: int -> the maximum number of generations where the distribution is kept
+    tolerance: float -> the largest decay of the first omitted term of the series
+    -----------------
+    output
+    solution: dict -> 'fixation' and 'loss': probability of fixation and loss of A by each generation, shape (generation, p)
+                      'distribution': probability of each bin of frequency at the kept generations (float32), shape (row, p, bin)
+                      'generations': the kept generations
+                      'frequencies': the centers of the bins
+    '''
+    from scipy.special import eval_jacobi, eval_legendre
+    from scipy.stats import norm
+    ps = np.asarray(ps, dtype=float)
+    nb_terms = max(nb_terms, int(np.ceil(np.sqrt(200 * np.log(1/tolerance))))) #first series generation below N/100
+    i = np.arange(1, nb_terms+1)[:,None] #index of the terms of the series
+    rates = (i*(i+1) / (2*size))[:,0] #decay rate of each term
+    start = min(int(np.ceil(np.log(1/tolerance) * 2*size / ((nb_terms+1)*(nb_terms+2)))), generations+1) #first generation of the series
+    edges = np.linspace(0, 1, nb_bins+1)
+    frequencies = (edges[:-1] + edges[1:]) / 2
+    saved = get_saved_generations(generations, nb_rows)
+    fixation, loss = np.zeros((generations+1, len(ps))), np.zeros((generations+1, len(ps)))
+    distribution = np.zeros((len(saved), len(ps), nb_bins), dtype=np.float32)
+
+    #Gaussian before the series, at generation 0 all the mass is at p
+    def get_sigma(t): #standard deviation of the frequency at the generations t, shape (generation, p)
+        return np.sqrt(ps*(1-ps) * -np.expm1(t[:,None] * np.log1p(-1/size)))
+    sigma = get_sigma(np.arange(1, start))
+    loss[1:start], fixation[1:start] = norm.cdf(-ps / sigma), norm.sf((1-ps) / sigma) #only the two outer edges at every generation
+    rows = np.flatnonzero((saved > 0) & (saved < start)) #the whole distribution only at the kept generations
+    distribution[rows] = np.diff(norm.cdf((edges[None,None,:] - ps[None,:,None]) / get_sigma(saved[rows])[:,:,None]), axis=2)
+    distribution[0, np.arange(len(ps)), np.minimum((ps*nb_bins).astype(int), nb_bins-1)] = 1
+
+    #series from the generation start, computed by blocks of generations
+    def gegenbauer(x): #F(1-i, i+2, 2, x) for each term i
+        return eval_jacobi(i-1, 1, 1, 1-2*x) / i
+    fixation_terms = (2*i+1) * ps*(1-ps) * (-1)**i * gegenbauer(ps) #shape (term, p)
+    loss_terms = (2*i+1) * ps*(1-ps) * (-1)**i * gegenbauer(1-ps)
+    coefficients = ps*(1-ps) * i*(i+1)*(2*i+1) * gegenbauer(ps) #coefficients of the density, shape (term, p)
+    integrals = (eval_legendre(i, 1-2*edges[:-1]) - eval_legendre(i, 1-2*edges[1:])) / (i*(i+1)) #integral of F(1-i, i+2, 2, x) over each bin, shape (term, bin)
+    block = max(1, 2**22 // nb_terms) #generations computed at once
+    for first in range(start, generations+1, block):
+        t = np.arange(first, min(first+block, generations+1))
+        decay = np.exp(-np.outer(t, rates)) #decay of each term at each generation, shape (generation, term)
+        fixation[t], loss[t] = ps + decay @ fixation_terms, (1-ps) + decay @ loss_terms
+        rows = np.flatnonzero((saved >= t[0]) & (saved <= t[-1]))
+        distribution[rows] = np.einsum('gi,ip,ix->gpx', decay[saved[rows] - t[0]], coefficients, integrals)
+
+    #the series is only accurate up to the tolerance
+    fixation, loss = np.clip(fixation, 0, 1), np.clip(loss, 0, 1)
+    distribution = np.clip(distribution, 0, None)
+    return {'fixation' : fixation, 'loss' : loss, 'distribution' : distribution, 'generations' : saved, 'frequencies' : frequencies}
+
+def plot_fitness(ps : list, fitness_list : np.ndarray, observed : np.ndarray, path : str, render : str = 'lines', size : int = 1):
     '''
+    Plot the fitness of the populations over the generations, one subplot for each probability p
+    -----------------
+    parameters
+    ps: list -> the probabilities of having the allele A
+    fitness_list: np.ndarray -> the fitness of each population, shape (p, simulation, generation)
+    observed: np.ndarray -> the fraction of populations with more A than B for each p
+    path: str -> the file of the figure
+    render: str -> the rendering of the trajectories ('lines', 'density', 'quantiles' or 'collection')
+    size: int -> fitness_list is divided by size when it is drawn (numbers of A of populations of this size)
+    '''
+    import matplotlib.pyplot as plt
     plt.figure( figsize=(15, 8) )
     plt.suptitle('Evolution of the fitness of a population with genetic drift')
+    for j in range(1,10):
+        ax = plt.subplot(3,3, j) #create a subplot
+        plot_trajectories(ax, fitness_list[j-1], render, size=size)
+        plt.title("Fitness over generations\np_expected = " + str(ps[j-1]) + ", p_observed = " + str(observed[j-1]))
+        plt.xlabel("Generations")
+        plt.ylabel("Fitness")
+    plt.tight_layout() #adjust the layout
+    plt.savefig(path, dpi= 300) #save the figure
+    plt.show()
 
+def main(argv : list = None):
+    '''
+    Here we create a population of 100 individuals with a probability of p in range(0.1, 1, 0.1) to have the allele A.
+    We do 100 simulations for each probability p and we plot the fitness of the population for each probability p for 1000 generations.
+    -----------------
+    parameter
+    argv: list -> the arguments of the program (those of the command line if None)
+    '''
+    args = get_parser().parse_args(argv) # parse the arguments
     size = args.size #size of the population
     generations = args.gen #number of generations
     nb_simulations = args.sim #number of simulations
+    engine = count_population if args.engine == 'count' else genotype_population #class used to simulate a population
+    ps = [j/10 for j in range(1,10)] #probabilities of having the allele A
 
-    with alive_bar( int(9*nb_simulations*generations), ctrl_c=True, title=f"Simulation\t") as bar:
-        for j in range(1,10): #for each probability p in range(0.1, 1, 0.1)
-            plt.subplot(3,3, j) #create a subplot
+    if args.analytic:
+        if size <= args.max_matrix:
+            solution = matrix_solution(size, ps, generations, args.rows)
+            interior = solution['distribution'][:,:,1:-1] #distribution of the frequencies where A is not fixed nor lost
+            extent = [0, generations, 1/size, 1-1/size]
+        else:
+            solution = diffusion_solution(size, ps, generations, args.terms, nb_rows=args.rows)
+            interior = solution['distribution']
+            extent = [0, generations, 0, 1]
 
-            p = j/10 #probability of having the allele A
-            cpt_A = 0 #number of individuals with the allele A in the population at the end of the simulation 
-
-            # We do nb_simulations simulations for each probability p
-            for k in range(nb_simulations):
-                #create the population
-                pop = population(size, p) 
-                bar()
-                #create the next generation
-                for i in range(generations):
-                    pop.next_generation()
-                    bar()
-
-                #get the genotypes of the population
-                if pop.get_genotypes().count('A') > pop.get_genotypes().count('B'): 
-                    cpt_A += 1
-                
-                #plot the fitness of the population for each probability p for 1000 generations
-                plt.plot(pop.get_fitness_list())
+        for j in range(1,10):
+            print(f"p = {ps[j-1]}: probability of fixation = {solution['fixation'][-1,j-1]:.6f}, probability of loss = {solution['loss'][-1,j-1]:.6f} at generation {generations}")
+        np.savez(f'genetic_drift_analytic_{args.size}_{args.gen}.npz', p=ps, **solution)
+        if args.no_plot:
+            return
 
-            plt.title("Fitness over generations\np_expected = " + str(p) + ", p_observed = " + str(cpt_A/nb_simulations))
+        import matplotlib.pyplot as plt
+        plt.figure( figsize=(15, 8) )
+        plt.suptitle('Evolution of the fitness of a population with genetic drift')
+        for j in range(1,10):
+            plt.subplot(3,3, j) #create a subplot
+            plt.imshow(interior[:,j-1].T, origin='lower', aspect='auto', extent=extent, cmap='viridis')
+            plt.title(f"Distribution of the fitness\np = {ps[j-1]}, P(fixation) = {solution['fixation'][-1,j-1]:.3f}, P(loss) = {solution['loss'][-1,j-1]:.3f}")
             plt.xlabel("Generations")
             plt.ylabel("Fitness")
+        plt.tight_layout() #adjust the layout
+        plt.savefig(f'genetic_drift_analytic_{args.size}_{args.gen}.png',dpi= 300) #save the figure
+        plt.show()
+        return
 
-    plt.tight_layout() #adjust the layout
-    plt.savefig(f'genetic_drift_{args.sim}_{args.size}_{args.gen}.png',dpi= 300) #save the figure
-    plt.show()    
+    if args.ensemble:
+        with progress(9*nb_simulations*generations, "Simulation", args.progress) as bar:
+            pop = ensemble_population(size, ps, nb_simulations, generations, store=not args.no_plot) #create all the populations, without trajectories if they are not drawn
+            for i in range(generations):
+                if not pop.step(): #every population is fixed or lost
+                    bar(9*nb_simulations*(generations-i))
+                    break
+                bar(9*nb_simulations)
+
+        if not args.no_plot: #number of A of each population over generations, padded in place and divided when drawn
+            fitness_list, scale = pop.get_count_list(generations), size
+        observed = pop.get_fixation() #fraction of populations fixed for A for each p
+        absorption = pop.get_absorption() #generation of fixation or loss of each population
+        fixed = pop.get_counts() == size #populations where A is fixed
+
+    else:
+        absorption = np.full((9, nb_simulations), -1) #generation of fixation or loss of each population
+        fixed = np.zeros((9, nb_simulations), dtype=bool) #populations where A is fixed
+        if not args.no_plot: #fitness of each population over generations
+            fitness_list, scale = np.zeros((9, nb_simulations, generations+1)), 1
+        observed = np.zeros(9) #fraction of populations with more A than B for each p
+        with progress(9*nb_simulations*generations, "Simulation", args.progress) as bar:
+            for j in range(1,10): #for each probability p in range(0.1, 1, 0.1)
+                p = j/10 #probability of having the allele A
+                cpt_A = 0 #number of individuals with the allele A in the population at the end of the simulation 
+
+                # We do nb_simulations simulations for each probability p
+                for k in range(nb_simulations):
+                    #create the population
+                    pop = engine(size, p) 
+                    #create the next generation until A is fixed or lost
+                    pop.step(generations)
+                    bar(generations) #the generations after the absorption are counted as done
+                    if pop.is_absorbed():
+                        absorption[j-1, k] = pop.get_generation()
+                        fixed[j-1, k] = pop.get_count() == size
+
+                    #get the number of A in the population
+                    if pop.get_count() > size - pop.get_count(): 
+                        cpt_A += 1
+                
+                    #fitness of the population for each probability p for 1000 generations
+                    if not args.no_plot:
+                        fitness_list[j-1, k] = pad_fitness_list(pop.get_fitness_list(), generations).ravel()
+
+                observed[j-1] = cpt_A/nb_simulations
+
+    #distribution of the fixation and loss times for each probability p
+    statistics = [absorption_statistics(absorption[j], fixed[j], args.bins) for j in range(9)]
+    for p, stat in zip(ps, statistics):
+        print(f"p = {p}: {stat['segregating']} not absorbed")
+        for name in ('fixation', 'loss'):
+            quantiles = ', '.join(f"q{int(100*q)} = {t:g}" for q, t in stat[name]['quantiles'].items())
+            print(f"\t{name}: {stat[name]['number']} populations, mean time = {stat[name]['mean']:g}, {quantiles}")
+    np.savez(f'genetic_drift_times_{args.sim}_{args.size}_{args.gen}.npz', p=ps, absorption=absorption, fixed=fixed,
+             **{f'{name}_histogram_{j+1}' : stat[name]['histogram'][0] for j, stat in enumerate(statistics) for name in ('fixation', 'loss')},
+             **{f'{name}_bins_{j+1}' : stat[name]['histogram'][1] for j, stat in enumerate(statistics) for name in ('fixation', 'loss')})
+
+    if not args.no_plot:
+        plot_fitness(ps, fitness_list, observed, f'genetic_drift_{args.sim}_{args.size}_{args.gen}.png', args.render, scale)
 
 if __name__ == '__main__':
     main()
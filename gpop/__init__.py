@@ -0,0 +1,19 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+'''
+Simulation core shared by the GPOP scripts. Every population is array backed and advanced with step(n_generations).
+'''
+
+from .base import simulation
+from .progress import progress
+from .drift import genotype_population, count_population, ensemble_population
+from .demes import (deme_population, island_matrix, stepping_stone_matrix, load_migration_matrix, neighbour_matrix,
+                    grid_matrix, graph_matrix)
+from .genealogy import genealogy_population, simplify_genealogy
+from .alleles import allele_history, diversity_statistics, allele_population, allele_count_population
+from .clones import clone_population
+from .dynamics import crossing_times
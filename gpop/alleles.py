@@ -0,0 +1,365 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+import numpy as np
+from bisect import bisect_right
+from typing import TYPE_CHECKING
+if TYPE_CHECKING: #scipy is only imported when it is used
+    from scipy import sparse
+from .base import simulation
+
+class allele_history():
+    '''
+    This class is used to store the allele counts of a population over the generations.
+    Each generation is one row of a sparse matrix in CSR form (identifiers and counts of its alleles), the rows are grouped
+    in chunks that can be streamed to .npz files, so the history is never stored as a dense (generation x allele) table.
+    '''
+    __slots__ = ('size', 'path', 'chunk', 'chunks', 'firsts', 'indptr', 'alleles', 'counts', 'nb_generations', 'nb_alleles')
+
+    def __init__(self, size : int, path : str = None, chunk : int = 1000):
+        '''
+        This function initialize an empty history
+        ----------------
+        parameters
+        size: int -> the size of the population
+        path: str -> the prefix of the .npz files of the chunks (kept in memory if None)
+        chunk: int -> the number of generations in each chunk
+        '''
+        self.size = size #size of the population
+        self.path = path #prefix of the files of the chunks
+        self.chunk = chunk #number of generations in each chunk
+        self.chunks = [] #finished chunks: arrays in memory or file names
+        self.firsts = [] #first generation of each finished chunk
+        self.indptr = [0] #first position of each generation of the current chunk in the identifiers and counts
+        self.alleles = [] #identifiers of the alleles of each generation of the current chunk
+        self.counts = [] #counts of the alleles of each generation of the current chunk
+        self.nb_generations = 0 #number of generations in the history
+        self.nb_alleles = 0 #largest identifier of an allele + 1
+
+    def append(self, alleles : np.ndarray, counts : np.ndarray):
+        '''
+        Add a generation to the history
+        -----------------
+        parameters
+        alleles: np.ndarray -> the identifiers of the alleles, in increasing order
+        counts: np.ndarray -> the number of individuals carrying each allele
+        '''
+        self.alleles.append(alleles)
+        self.counts.append(counts)
+        self.indptr.append(self.indptr[-1] + len(alleles))
+        self.nb_generations += 1
+        if len(alleles):
+            self.nb_alleles = max(self.nb_alleles, int(alleles[-1]) + 1)
+        if len(self.alleles) == self.chunk:
+            self.flush()
+
+    def flush(self):
+        '''
+        Close the current chunk, it is saved in a .npz file if the history has a path
+        '''
+        if not self.alleles:
+            return
+        chunk = {'first' : self.nb_generations - len(self.alleles), 'indptr' : np.array(self.indptr),
+                 'alleles' : np.concatenate(self.alleles), 'counts' : np.concatenate(self.counts)}
+        if self.path is not None:
+            name = f"{self.path}_{len(self.chunks):05d}.npz"
+            np.savez(name, **chunk)
+            chunk = name
+        self.chunks.append(chunk)
+        self.firsts.append(self.nb_generations - len(self.alleles))
+        self.indptr, self.alleles, self.counts = [0], [], []
+
+    def get_chunks(self):
+        '''
+        Iterate over the chunks of the history, including the current one
+        -----------------
+        output
+        chunk: dict -> 'first': the first generation of the chunk, 'indptr', 'alleles', 'counts': the rows of the chunk in CSR form
+        '''
+        for chunk in self.chunks:
+            yield dict(np.load(chunk)) if isinstance(chunk, str) else chunk
+        if self.alleles:
+            yield {'first' : self.nb_generations - len(self.alleles), 'indptr' : np.array(self.indptr),
+                   'alleles' : np.concatenate(self.alleles), 'counts' : np.concatenate(self.counts)}
+
+    def get_generation(self, t : int) -> tuple:
+        '''
+        Get the alleles of a generation
+        -----------------
+        parameter
+        t: int -> the generation (the first generation of the history is 0)
+        -----------------
+        output
+        alleles: np.ndarray -> the identifiers of the alleles
+        frequencies: np.ndarray -> the frequency of each allele
+        '''
+        if not 0 <= t < self.nb_generations:
+            raise IndexError(f"generation {t} is not in the history")
+        current = self.nb_generations - len(self.alleles) #first generation of the current chunk
+        if t >= current:
+            return self.alleles[t-current], self.counts[t-current] / self.size
+        #only the chunk of t is read, found from the first generations of the chunks (a flush can end a chunk early)
+        chunk = self.chunks[bisect_right(self.firsts, t) - 1]
+        chunk = dict(np.load(chunk)) if isinstance(chunk, str) else chunk
+        row = t - chunk['first']
+        start, end = chunk['indptr'][row], chunk['indptr'][row+1]
+        return chunk['alleles'][start:end], chunk['counts'][start:end] / self.size
+
+    def spectrum(self, t : int) -> np.ndarray:
+        '''
+        Get the allele frequency spectrum of a generation
+        -----------------
+        parameter
+        t: int -> the generation
+        -----------------
+        output
+        spectrum: np.ndarray -> spectrum[i] is the number of alleles carried by i individuals
+        '''
+        alleles, frequencies = self.get_generation(t)
+        return np.bincount(np.rint(frequencies * self.size).astype(np.int64), minlength=self.size+1)
+
+    def trajectory(self, k : int) -> np.ndarray:
+        '''
+        Get the trajectory of an allele
+        -----------------
+        parameter
+        k: int -> the identifier of the allele
+        -----------------
+        output
+        trajectory: np.ndarray -> the frequency of the allele at each generation
+        '''
+        trajectory = np.zeros(self.nb_generations)
+        for chunk in self.get_chunks():
+            positions = np.flatnonzero(chunk['alleles'] == k)
+            rows = np.searchsorted(chunk['indptr'], positions, side='right') - 1
+            trajectory[chunk['first'] + rows] = chunk['counts'][positions] / self.size
+        return trajectory
+
+    def to_sparse(self) -> 'sparse.csr_matrix':
+        '''
+        Get the whole history as a sparse matrix
+        -----------------
+        output
+        history: sparse.csr_matrix -> history[t, k] is the frequency of the allele k at the generation t
+        '''
+        from scipy import sparse
+        rows = [sparse.csr_matrix((chunk['counts'] / self.size, chunk['alleles'], chunk['indptr']), shape=(len(chunk['indptr'])-1, self.nb_alleles))
+                for chunk in self.get_chunks()]
+        return sparse.vstack(rows, format='csr') if rows else sparse.csr_matrix((0, self.nb_alleles))
+
+class diversity_statistics():
+    '''
+    This class is used to follow the diversity of a population over the generations: the expected homozygosity
+    F = sum(p_k^2) and the number K of segregating alleles. Their running means over a window of generations are
+    updated in O(1). The equilibrium is detected when the means of F over the last two windows both match the
+    mutation-drift equilibrium F = 1/(1+2Nµ).
+    '''
+    __slots__ = ('size', 'theta', 'window', 'tolerance', 'homozygosity', 'nb_alleles', 'sum_homozygosity', 'sum_nb_alleles', 'sum_previous_homozygosity')
+
+    def __init__(self, size : int, µ : float, window : int = 100, tolerance : float = 0.05):
+        '''
+        This function initialize empty statistics
+        ----------------
+        parameters
+        size: int -> the size of the population
+        µ: float -> mutation rate
+        window: int -> the number of generations of the running means
+        tolerance: float -> the relative tolerance between the running mean of F and its expectation at equilibrium
+        '''
+        self.size = size #size of the population
+        self.theta = 2*size*µ #population mutation rate
+        self.window = window #number of generations of the running means
+        self.tolerance = tolerance #relative tolerance of the equilibrium
+        self.homozygosity = [] #expected homozygosity at each generation
+        self.nb_alleles = [] #number of segregating alleles at each generation
+        self.sum_homozygosity = 0 #sum of the homozygosity over the window
+        self.sum_nb_alleles = 0 #sum of the number of alleles over the window
+        self.sum_previous_homozygosity = 0 #sum of the homozygosity over the previous window
+
+    def update(self, counts : np.ndarray):
+        '''
+        Add a generation to the statistics
+        -----------------
+        parameter
+        counts: np.ndarray -> the number of individuals carrying each segregating allele
+        '''
+        frequencies = counts / self.size
+        self.homozygosity.append(float(frequencies @ frequencies))
+        self.nb_alleles.append(len(counts))
+        self.sum_homozygosity += self.homozygosity[-1]
+        self.sum_nb_alleles += self.nb_alleles[-1]
+        if len(self.homozygosity) > self.window: #the oldest generation leaves the window for the previous one
+            self.sum_homozygosity -= self.homozygosity[-self.window-1]
+            self.sum_nb_alleles -= self.nb_alleles[-self.window-1]
+            self.sum_previous_homozygosity += self.homozygosity[-self.window-1]
+        if len(self.homozygosity) > 2*self.window:
+            self.sum_previous_homozygosity -= self.homozygosity[-2*self.window-1]
+
+    def get_mean_homozygosity(self) -> float: #get the mean homozygosity over the window
+        return self.sum_homozygosity / min(len(self.homozygosity), self.window)
+
+    def get_mean_nb_alleles(self) -> float: #get the mean number of segregating alleles over the window
+        return self.sum_nb_alleles / min(len(self.nb_alleles), self.window)
+
+    def get_expected_homozygosity(self) -> float: #get the homozygosity at the mutation-drift equilibrium
+        return 1 / (1 + self.theta)
+
+    def is_at_equilibrium(self) -> bool:
+        '''
+        Check if the population is at the mutation-drift equilibrium: the mean homozygosity over the last window
+        and over the previous one are both within the tolerance of its expectation
+        '''
+        expected = self.get_expected_homozygosity()
+        return (len(self.homozygosity) >= 2*self.window
+                and abs(self.get_mean_homozygosity() - expected) <= self.tolerance * expected
+                and abs(self.sum_previous_homozygosity / self.window - expected) <= self.tolerance * expected)
+
+    def get_summary(self) -> dict:
+        '''
+        Get the Ewens-Watterson statistics of the last generation
+        -----------------
+        output
+        summary: dict -> 'homozygosity': F, 'nb_alleles': K, 'mean_homozygosity', 'mean_nb_alleles': their means over the window,
+                         'theta_F': the mutation rate estimated from F (1/F - 1),
+                         'theta_K': the mutation rate estimated from K with the Ewens formula E[K] = sum(theta/(theta+i), i < N),
+                         'expected_homozygosity_K': the homozygosity expected from theta_K, to compare with F (Watterson test)
+        '''
+        from scipy.optimize import brentq
+        K = self.nb_alleles[-1]
+        i = np.arange(self.size)
+        if K <= 1: #a single allele: no mutation
+            theta_K = 0.0
+        elif K >= self.size: #every individual carries its own allele: sum(theta/(theta+i)) < N for every finite theta
+            theta_K = np.inf
+        else:
+            theta_K = brentq(lambda theta: np.sum(theta / (theta + i)) - K, 1e-12, 1e12)
+        return {'homozygosity' : self.homozygosity[-1], 'nb_alleles' : K,
+                'mean_homozygosity' : self.get_mean_homozygosity(), 'mean_nb_alleles' : self.get_mean_nb_alleles(),
+                'theta_F' : 1 / self.homozygosity[-1] - 1, 'theta_K' : theta_K,
+                'expected_homozygosity_K' : 0.0 if np.isinf(theta_K) else 1 / (1 + theta_K)}
+
+class allele_population(simulation):
+    '''
+    This class is used to simulate a population individual by individual: the allele of each individual is stored
+    in an array of identifiers. Each individual of the next generation is a new mutant with the probability µ,
+    otherwise it copies the allele of a random parent.
+    '''
+    __slots__ = ('size', 'generation', 'mutation_rate', 'rng', 'population', 'next_allele', 'history', 'statistics')
+
+    def __init__(self, size : int, µ : float, history : allele_history = None, statistics : diversity_statistics = None, rng : np.random.Generator = None):
+        '''
+        This function initialize the parameters of the population from generation 0
+        ----------------
+        parameters
+        size: int -> the size of the population
+        µ: float -> mutation rate
+        history: allele_history -> the history of the allele counts (a new one in memory if None)
+        statistics: diversity_statistics -> the diversity statistics (new ones if None)
+        rng: np.random.Generator -> the random generator (a new one if None)
+        '''
+        self.size = size #size of the population
+        self.generation = 0 #number of the generation
+        self.mutation_rate = µ #mutation rate
+        self.rng = np.random.default_rng() if rng is None else rng #random generator
+        self.population = np.zeros(self.size, dtype=np.int64) #allele of each individual
+        self.next_allele = 1 #identifier of the next new allele
+        self.history = allele_history(self.size) if history is None else history #history of the allele counts
+        self.statistics = diversity_statistics(self.size, µ) if statistics is None else statistics #diversity statistics
+
+    def get_fitness(self) -> dict: #get the fitness of the population
+        alleles, counts = np.unique(self.population, return_counts=True)
+        return {f"{k}" : c/self.size for k, c in zip(alleles, counts)}
+
+    #create new generation from the last one
+    def next_generation(self):
+        '''
+        This function create the next generation from the last one
+        '''
+        self.population = self.population[self.rng.integers(0, self.size, self.size)] #copy the allele of a random parent
+        mutants = np.flatnonzero(self.rng.random(self.size) < self.mutation_rate)
+        self.population[mutants] = np.arange(self.next_allele, self.next_allele + len(mutants)) #each mutant carries a new allele
+        self.next_allele += len(mutants)
+
+        alleles, counts = np.unique(self.population, return_counts=True)
+        self.history.append(alleles, counts) #add the allele counts to the history
+        self.statistics.update(counts) #update the diversity statistics
+        self.generation += 1 #add 1 to the generation number
+
+    def get_generation(self) -> int: #get the generation number
+        return self.generation
+
+    def get_fitness_list(self) -> allele_history: #get the history of the allele counts
+        return self.history
+
+    def get_population(self) -> np.ndarray: #get the allele of each individual
+        return self.population
+
+    def get_statistics(self) -> diversity_statistics: #get the diversity statistics
+        return self.statistics
+
+class allele_count_population(simulation):
+    '''
+    This class is used to simulate a population by the number of individuals carrying each allele.
+    The alleles with at least one individual are stored in increasing order in two arrays (identifiers and counts),
+    so the cost of a generation depends on the number of segregating alleles, not on the size of the population.
+    '''
+    __slots__ = ('size', 'generation', 'mutation_rate', 'rng', 'alleles', 'counts', 'next_allele', 'history', 'statistics')
+
+    def __init__(self, size : int, µ : float, history : allele_history = None, statistics : diversity_statistics = None, rng : np.random.Generator = None):
+        '''
+        This function initialize the parameters of the population from generation 0
+        ----------------
+        parameters
+        size: int -> the size of the population
+        µ: float -> mutation rate
+        history: allele_history -> the history of the allele counts (a new one in memory if None)
+        statistics: diversity_statistics -> the diversity statistics (new ones if None)
+        rng: np.random.Generator -> the random generator (a new one if None)
+        '''
+        self.size = size #size of the population
+        self.generation = 0 #number of the generation
+        self.mutation_rate = µ #mutation rate
+        self.rng = np.random.default_rng() if rng is None else rng #random generator
+        self.alleles = np.zeros(1, dtype=np.int64) #identifiers of the segregating alleles
+        self.counts = np.array([self.size], dtype=np.int64) #number of individuals carrying each allele
+        self.next_allele = 1 #identifier of the next new allele
+        self.history = allele_history(self.size) if history is None else history #history of the allele counts
+        self.statistics = diversity_statistics(self.size, µ) if statistics is None else statistics #diversity statistics
+
+    def get_fitness(self) -> dict: #get the fitness of the population
+        return {f"{k}" : c/self.size for k, c in zip(self.alleles, self.counts)}
+
+    #create new generation from the last one
+    def next_generation(self):
+        '''
+        This function create the next generation from the last one.
+        Each individual is a new mutant with the probability µ, otherwise it copies the allele of a random parent
+        '''
+        nb_mutants = self.rng.binomial(self.size, self.mutation_rate) #number of new mutants
+        counts = self.rng.multinomial(self.size - nb_mutants, self.counts / self.size) #resample the parents
+        kept = counts > 0 #remove the lost alleles
+        self.alleles = np.concatenate([self.alleles[kept], np.arange(self.next_allele, self.next_allele + nb_mutants)])
+        self.counts = np.concatenate([counts[kept], np.ones(nb_mutants, dtype=np.int64)])
+        self.next_allele += nb_mutants
+
+        self.history.append(self.alleles, self.counts) #add the allele counts to the history
+        self.statistics.update(self.counts) #update the diversity statistics
+        self.generation += 1 #add 1 to the generation number
+
+    def get_generation(self) -> int: #get the generation number
+        return self.generation
+
+    def get_fitness_list(self) -> allele_history: #get the history of the allele counts
+        return self.history
+
+    def get_alleles(self) -> np.ndarray: #get the identifiers of the segregating alleles
+        return self.alleles
+
+    def get_counts(self) -> np.ndarray: #get the number of individuals carrying each segregating allele
+        return self.counts
+
+    def get_statistics(self) -> diversity_statistics: #get the diversity statistics
+        return self.statistics
@@ -0,0 +1,70 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+class simulation():
+    '''
+    This class is the common interface of the populations of the package.
+    A population defines next_generation and get_generation, and is_absorbed when the simulation can end by itself
+    (fixation or loss of an allele, a single common ancestor...), and get_capacity when its storage is preallocated for
+    a number of generations. The generations are advanced with step, or with run
+    which reports the progress by batches of generations.
+    '''
+    __slots__ = ()
+
+    def next_generation(self): #create the next generation from the last one
+        raise NotImplementedError
+
+    def get_generation(self) -> int: #get the generation number
+        raise NotImplementedError
+
+    def is_absorbed(self) -> bool: #check if the simulation has reached an absorbing state
+        return False
+
+    def get_capacity(self): #get the number of generations that can still be created (None if unlimited)
+        return None
+
+    def step(self, n_generations : int = 1) -> int:
+        '''
+        Advance the population of n_generations generations, or until it is absorbed or its preallocated
+        generations are all created
+        -----------------
+        parameter
+        n_generations: int -> the maximum number of generations
+        -----------------
+        output
+        done: int -> the number of generations created
+        '''
+        capacity = self.get_capacity()
+        if capacity is not None:
+            n_generations = min(n_generations, capacity)
+        for i in range(n_generations):
+            if self.is_absorbed():
+                return i
+            self.next_generation()
+        return n_generations
+
+    def run(self, n_generations : int, bar = None) -> int:
+        '''
+        Advance the population of n_generations generations, or until it is absorbed or full, by batches of generations
+        between the checkpoints of a progress, so the progress is not called at each generation
+        -----------------
+        parameters
+        n_generations: int -> the maximum number of generations
+        bar: progress -> the progress of the simulation, called with the number of generations of each batch (None for no progress)
+        -----------------
+        output
+        done: int -> the number of generations created
+        '''
+        done = 0
+        while done < n_generations:
+            batch = n_generations - done if bar is None else min(bar.get_batch(), n_generations - done)
+            created = self.step(batch)
+            done += created
+            if bar is not None:
+                bar(created)
+            if created < batch: #the population is absorbed or full
+                break
+        return done
@@ -0,0 +1,106 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+import numpy as np
+from .base import simulation
+
+class clone_population(simulation):
+    '''
+    This class is used to simulate clonal interference in a finite population with the Wright-Fisher model.
+    The population is stored as the counts and the fitnesses of its living clones. At each generation the individuals
+    are resampled with weights proportional to the fitness, then a Poisson number of new beneficial clones arise, each
+    from one individual, and the extinct clones are removed.
+    The fitnesses are divided by the mean fitness at each generation, the log of the mean fitness is accumulated apart.
+    '''
+    __slots__ = ('size', 'U', 'sb', 'record', 'rng', 'generation', 'clones', 'counts', 'fitness', 'next_clone',
+                 'log_mean_fitness', 'indptr', 'recorded_clones', 'recorded_counts')
+    def __init__(self, size : int, U : float, sb : float, record : int = 10, rng : np.random.Generator = None):
+        '''
+        This function initialize the population from generation 0 with one clone
+        ----------------
+        parameters
+        size: int -> the size of the population
+        U: float -> the beneficial mutation rate per individual and generation
+        sb: float -> the mean selection coefficient of the new clones
+        record: int -> the number of generations between two records of the clone counts
+        rng: np.random.Generator -> the random generator (a new one if None)
+        '''
+        self.size = size #size of the population
+        self.U = U #beneficial mutation rate
+        self.sb = sb #mean selection coefficient of the new clones
+        self.record = record #number of generations between two records
+        self.rng = np.random.default_rng() if rng is None else rng #random generator
+        self.generation = 0 #number of the generation
+        self.clones = np.zeros(1, dtype=np.int64) #identifiers of the living clones
+        self.counts = np.array([self.size], dtype=np.int64) #number of individuals of each clone
+        self.fitness = np.ones(1) #fitness of each clone relative to the mean fitness
+        self.next_clone = 1 #identifier of the next new clone
+        self.log_mean_fitness = [0.0] #log of the mean fitness at each generation
+        self.indptr, self.recorded_clones, self.recorded_counts = [0], [], [] #recorded clone counts in CSR form
+        self.record_counts()
+
+    def record_counts(self): #record the counts of the living clones
+        self.recorded_clones.append(self.clones)
+        self.recorded_counts.append(self.counts)
+        self.indptr.append(self.indptr[-1] + len(self.clones))
+
+    #create new generation from the last one
+    def next_generation(self):
+        '''
+        This function create the next generation from the last one
+        '''
+        weights = self.counts * self.fitness
+        mean_fitness = weights.sum() / self.size
+        self.counts = self.rng.multinomial(self.size, weights / weights.sum()) #resampling weighted by the fitness
+        self.fitness = self.fitness / mean_fitness
+        self.log_mean_fitness.append(self.log_mean_fitness[-1] + np.log(mean_fitness))
+
+        nb_mutants = min(self.rng.poisson(self.size * self.U), self.size) #number of new clones
+        if nb_mutants:
+            individuals = self.rng.choice(self.size, nb_mutants, replace=False) #individuals where the mutations arise
+            parents = np.searchsorted(np.cumsum(self.counts), individuals, side='right') #clone of each of these individuals
+            self.counts = self.counts - np.bincount(parents, minlength=len(self.counts))
+            self.clones = np.concatenate([self.clones, np.arange(self.next_clone, self.next_clone + nb_mutants)])
+            self.counts = np.concatenate([self.counts, np.ones(nb_mutants, dtype=np.int64)])
+            self.fitness = np.concatenate([self.fitness, self.fitness[parents] * (1 + self.rng.exponential(self.sb, nb_mutants))])
+            self.next_clone += nb_mutants
+
+        alive = self.counts > 0 #remove the extinct clones
+        self.clones, self.counts, self.fitness = self.clones[alive], self.counts[alive], self.fitness[alive]
+        self.generation += 1
+        if self.generation % self.record == 0:
+            self.record_counts()
+
+    def get_generation(self) -> int: #get the generation number
+        return self.generation
+
+    def get_nb_clones(self) -> int: #get the number of clones arisen since generation 0
+        return self.next_clone - 1
+
+    def get_nb_alive(self) -> int: #get the number of living clones
+        return len(self.clones)
+
+    def get_log_mean_fitness(self) -> np.ndarray: #get the log of the mean fitness at each generation
+        return np.array(self.log_mean_fitness)
+
+    def get_rate_of_adaptation(self) -> float:
+        '''
+        Get the rate of adaptation: the slope of the log of the mean fitness over the second half of the generations
+        '''
+        log_mean_fitness = self.get_log_mean_fitness()
+        generations = np.arange(len(log_mean_fitness))
+        half = len(log_mean_fitness) // 2
+        return np.polyfit(generations[half:], log_mean_fitness[half:], 1)[0] if len(log_mean_fitness) - half >= 2 else np.nan
+
+    def get_trajectories(self) -> dict:
+        '''
+        Get the recorded clone counts
+        -----------------
+        output
+        trajectories: dict -> 'generations': the recorded generations, 'indptr', 'clones', 'counts': the clone counts of each record in CSR form
+        '''
+        return {'generations' : np.arange(len(self.indptr)-1) * self.record, 'indptr' : np.array(self.indptr),
+                'clones' : np.concatenate(self.recorded_clones), 'counts' : np.concatenate(self.recorded_counts)}
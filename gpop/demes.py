@@ -0,0 +1,286 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+import numpy as np
+from .base import simulation
+
+class deme_population(simulation):
+    '''
+    This class is used to simulate a population subdivided in subpopulations (demes), with or without migration.
+    The state is the vector of the number of individuals with the allele A in each deme. With migration, the frequencies of
+    the parents are mixed with the backward migration matrix (p' = M p) before every deme is drawn with one vectorized binomial
+    sample, so the cost per generation is O(D^2) (O(nnz) for a sparse matrix), independent of the sizes. Without migration,
+    the demes where A is fixed or lost are frozen and only the active demes are drawn.
+    The heterozygosities H_S (mean within the demes), H_T (total population) and Fst = (H_T - H_S) / H_T are computed
+    at each generation from running sums updated only on the drawn demes.
+    The frequencies can be written in chunks of generations to a memory-mapped .npy file for large landscapes.
+    '''
+    __slots__ = ('sizes', 'total', 'M', 'p', 'rng', 'generation', 'counts', 'active', 'path', 'history', 'buffer', 'first',
+                 'statistics', 'sum_counts', 'sum_squares')
+
+    def __init__(self, sizes : np.ndarray, p : float, generations : int, M = None, rng : np.random.Generator = None, path : str = None, chunk : int = 256):
+        '''
+        This function initialize the parameters of the population from generation 0
+        ----------------
+        parameters
+        sizes: np.ndarray -> the size of each deme
+        p: float -> the probability of having the genotype A
+        generations: int -> the number of generations to store in the history
+        M: np.ndarray | scipy.sparse matrix -> the backward migration matrix (D, D), no migration if None
+        rng: np.random.Generator -> the random generator (a new one if None)
+        path: str -> the .npy file of the memory-mapped frequencies (generation x deme), kept in memory if None
+        chunk: int -> the number of generations written to the file at once
+        '''
+        self.sizes = np.asarray(sizes, dtype=np.int64) #size of each deme
+        D = len(self.sizes)
+        if M is not None and M.shape != (D, D):
+            raise ValueError(f"The migration matrix has shape {M.shape} for {D} demes")
+        self.total = int(self.sizes.sum()) #size of the whole population
+        self.M = M #backward migration matrix
+        self.p = p #probability of having the allele A
+        self.rng = np.random.default_rng() if rng is None else rng #random generator
+        self.generation = 0 #number of the generation
+        self.counts = self.rng.binomial(self.sizes, self.p) #number of A in each deme
+        self.active = np.flatnonzero((self.counts > 0) & (self.counts < self.sizes)) #demes where A is neither fixed nor lost
+        self.path = path #file of the memory-mapped frequencies
+        if path is None:
+            self.history = np.zeros((generations+1, D), dtype=np.min_scalar_type(self.sizes.max())) #number of A in each deme at each generation
+            self.history[0] = self.counts
+        else:
+            self.history = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(generations+1, D)) #frequency of A in each deme at each generation
+            self.buffer = np.empty((min(chunk, generations+1), D), dtype=np.float32) #frequencies of the generations not yet written
+            self.first = 0 #first generation of the buffer
+            self.buffer[0] = self.counts / self.sizes
+        self.statistics = np.zeros((generations+1, 3)) #H_S, H_T and Fst at each generation
+        self.sum_counts = int(self.counts.sum()) #number of A in the whole population
+        self.sum_squares = float(np.sum(self.counts**2 / self.sizes)) #sum over the demes of size * frequency**2
+        self.update_statistics()
+
+    def update_statistics(self):
+        '''
+        This function compute H_S, H_T and Fst of the current generation from the running sums
+        '''
+        p_mean = self.sum_counts / self.total #frequency of A in the whole population
+        H_S = max(2 * (p_mean - self.sum_squares / self.total), 0.0) #mean within deme heterozygosity weighted by the deme sizes
+        H_T = 2 * p_mean * (1 - p_mean) #total heterozygosity
+        Fst = (H_T - H_S) / H_T if H_T > 0 else 0.0
+        self.statistics[self.generation] = H_S, H_T, Fst
+
+    #create new generation from the last one
+    def next_generation(self):
+        '''
+        This function create the next generation of the demes from the last one
+        '''
+        if self.M is None: #only the active demes change, absorbed demes are frozen
+            drawn = self.active
+            old = self.counts[drawn]
+            sizes = self.sizes[drawn]
+            new = self.rng.binomial(sizes, old / sizes) #draw the new numbers of A
+            self.counts[drawn] = new
+            self.active = drawn[(new > 0) & (new < sizes)] #remove the demes which are absorbed
+        else:
+            old, sizes = self.counts, self.sizes
+            parents = self.M @ (old / sizes) #frequency of A among the parents of each deme after migration
+            new = self.rng.binomial(sizes, np.clip(parents, 0.0, 1.0)) #draw the new numbers of A
+            self.counts = new
+        self.sum_counts += int(new.sum() - old.sum())
+        self.sum_squares += float(np.sum((new**2 - old**2) / sizes))
+
+        if self.path is not None and self.generation + 1 - self.first == len(self.buffer): #the buffer is full
+            self.flush()
+        self.generation += 1 #add 1 to the generation number
+        if self.path is None:
+            self.history[self.generation] = self.counts
+        else:
+            self.buffer[self.generation - self.first] = self.counts / self.sizes
+        self.update_statistics()
+
+    def flush(self):
+        '''
+        Write the generations of the buffer to the memory-mapped file
+        '''
+        if self.path is None:
+            return
+        n = self.generation + 1 - self.first #number of generations in the buffer
+        if n > 0:
+            self.history[self.first:self.first+n] = self.buffer[:n]
+            self.history.flush()
+            self.first += n
+
+    def get_capacity(self) -> int: #get the number of generations that can still be stored
+        return len(self.statistics) - 1 - self.generation
+
+    def is_absorbed(self) -> bool: #all the demes have fixed or lost A (the whole population with migration)
+        if self.M is None:
+            return self.active.size == 0
+        return self.sum_counts in (0, self.total)
+
+    def get_generation(self) -> int: #get the generation number
+        return self.generation
+
+    def get_fitness(self) -> np.ndarray: #get the frequency of A in each deme
+        return self.counts / self.sizes
+
+    def get_fitness_list(self) -> np.ndarray: #get the frequency of A in each deme at each generation, shape (generation, deme)
+        if self.path is None:
+            return self.history[:self.generation+1] / self.sizes
+        self.flush()
+        return self.history[:self.generation+1]
+
+    def get_statistics(self) -> np.ndarray: #get H_S, H_T and Fst at each generation, shape (generation, 3)
+        return self.statistics[:self.generation+1]
+
+def island_matrix(D : int, m : float, sparse : bool = False):
+    '''
+    This function create the backward migration matrix of the island model: a parent comes from the same deme
+    with probability 1-m, or from any of the D-1 other demes with probability m/(D-1)
+    ----------------
+    parameters
+    D: int -> the number of demes
+    m: float -> the migration rate
+    sparse: bool -> return a sparse matrix
+    -----------------
+    output
+    M: np.ndarray | scipy.sparse.csr_matrix -> M[i, j] the probability that a parent of an individual of deme i comes from deme j
+    '''
+    import scipy.sparse
+    M = np.full((D, D), m / (D - 1)) if D > 1 else np.zeros((1, 1))
+    np.fill_diagonal(M, 1 - m if D > 1 else 1.0)
+    return scipy.sparse.csr_matrix(M) if sparse else M
+
+def stepping_stone_matrix(D : int, m : float, sparse : bool = False):
+    '''
+    This function create the backward migration matrix of the stepping-stone model on a ring: a parent comes from
+    the same deme with probability 1-m, or from one of the two neighbouring demes with probability m/2
+    ----------------
+    parameters
+    D: int -> the number of demes
+    m: float -> the migration rate
+    sparse: bool -> return a sparse matrix
+    -----------------
+    output
+    M: np.ndarray | scipy.sparse.csr_matrix -> M[i, j] the probability that a parent of an individual of deme i comes from deme j
+    '''
+    import scipy.sparse
+    demes = np.arange(D)
+    rows = np.concatenate([demes, demes, demes])
+    cols = np.concatenate([demes, (demes - 1) % D, (demes + 1) % D])
+    values = np.concatenate([np.full(D, 1 - m), np.full(2 * D, m / 2)])
+    M = scipy.sparse.csr_matrix((values, (rows, cols)), shape=(D, D)) #duplicates are summed (D <= 2)
+    return M if sparse else M.toarray()
+
+def load_migration_matrix(path : str, sparse : bool = False):
+    '''
+    This function load a backward migration matrix given by the user and check that each row sums to 1
+    ----------------
+    parameters
+    path: str -> the file of the matrix (.npy, .npz saved with scipy.sparse.save_npz, or text)
+    sparse: bool -> return a sparse matrix
+    -----------------
+    output
+    M: np.ndarray | scipy.sparse.csr_matrix -> M[i, j] the probability that a parent of an individual of deme i comes from deme j
+    '''
+    import scipy.sparse
+    if path.endswith('.npz'):
+        M = scipy.sparse.load_npz(path).tocsr()
+    elif path.endswith('.npy'):
+        M = np.load(path)
+    else:
+        M = np.loadtxt(path, ndmin=2)
+    if M.ndim != 2 or M.shape[0] != M.shape[1]:
+        raise ValueError(f"The migration matrix must be square, got shape {M.shape}")
+    if not np.allclose(np.asarray(M.sum(axis=1)).ravel(), 1.0):
+        raise ValueError("Each row of the migration matrix must sum to 1")
+    if sparse:
+        return scipy.sparse.csr_matrix(M)
+    return M.toarray() if scipy.sparse.issparse(M) else M
+
+def neighbour_matrix(rows : np.ndarray, cols : np.ndarray, weights : np.ndarray, D : int, m : float):
+    '''
+    This function create the sparse backward migration matrix of a network of demes: a parent comes from the same deme
+    with probability 1-m, or from a neighbour with probability m shared in proportion to the weights of the edges
+    ----------------
+    parameters
+    rows: np.ndarray -> the first deme of each undirected edge
+    cols: np.ndarray -> the second deme of each undirected edge
+    weights: np.ndarray -> the weight of each edge
+    D: int -> the number of demes
+    m: float -> the migration rate
+    -----------------
+    output
+    M: scipy.sparse.csr_matrix -> M[i, j] the probability that a parent of an individual of deme i comes from deme j
+    '''
+    import scipy.sparse
+    keep = rows != cols #self loops are not migrations
+    rows, cols, weights = rows[keep], cols[keep], weights[keep]
+    W = scipy.sparse.csr_matrix((np.concatenate([weights, weights]), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))), shape=(D, D))
+    degree = np.asarray(W.sum(axis=1)).ravel()
+    scale = np.divide(m, degree, out=np.zeros(D), where=degree > 0)
+    stay = np.where(degree > 0, 1 - m, 1.0) #an isolated deme receives no migrants
+    return (scipy.sparse.diags(scale) @ W + scipy.sparse.diags(stay)).tocsr()
+
+def grid_matrix(nb_rows : int, nb_columns : int, m : float, torus : bool = False):
+    '''
+    This function create the sparse backward migration matrix of a 2-D lattice of demes, each deme exchanging
+    migrants with its 4 nearest neighbours. Deme (r, c) has the index r * nb_columns + c
+    ----------------
+    parameters
+    nb_rows: int -> the number of rows of the lattice
+    nb_columns: int -> the number of columns of the lattice
+    m: float -> the migration rate
+    torus: bool -> wrap the edges of the lattice
+    -----------------
+    output
+    M: scipy.sparse.csr_matrix -> M[i, j] the probability that a parent of an individual of deme i comes from deme j
+    '''
+    index = np.arange(nb_rows * nb_columns).reshape(nb_rows, nb_columns)
+    if torus:
+        right, down = np.roll(index, -1, axis=1), np.roll(index, -1, axis=0)
+        rows = np.concatenate([index.ravel(), index.ravel()])
+        cols = np.concatenate([right.ravel(), down.ravel()])
+        rows, cols = np.unique(np.sort(np.stack([rows, cols]), axis=0), axis=1) #with 2 rows or columns both neighbours are the same deme
+    else:
+        rows = np.concatenate([index[:, :-1].ravel(), index[:-1, :].ravel()])
+        cols = np.concatenate([index[:, 1:].ravel(), index[1:, :].ravel()])
+    return neighbour_matrix(rows, cols, np.ones(len(rows)), nb_rows * nb_columns, m)
+
+def graph_matrix(path : str, m : float, D : int = None):
+    '''
+    This function create the sparse backward migration matrix of a network of demes given by an edge list file
+    ----------------
+    parameters
+    path: str -> the edge list file, one "i j [weight]" line per undirected edge (demes numbered from 0, weight 1 if omitted)
+    m: float -> the migration rate
+    D: int -> the number of demes (largest index + 1 if None)
+    -----------------
+    output
+    M: scipy.sparse.csr_matrix -> M[i, j] the probability that a parent of an individual of deme i comes from deme j
+    '''
+    rows, cols, weights = [], [], []
+    with open(path) as file:
+        for number, line in enumerate(file, 1): #one edge per line, a line without weight has the weight 1
+            fields = line.split('#')[0].split()
+            if not fields: #empty line or comment
+                continue
+            try:
+                if len(fields) not in (2, 3):
+                    raise ValueError
+                i, j, weight = int(fields[0]), int(fields[1]), float(fields[2]) if len(fields) == 3 else 1.0
+            except ValueError:
+                raise ValueError(f"Line {number} of {path}: expected \"i j [weight]\" with integer demes, got {line.strip()!r}") from None
+            if i < 0 or j < 0 or weight < 0:
+                raise ValueError(f"Line {number} of {path}: the demes and the weight must be non-negative, got {line.strip()!r}")
+            rows.append(i)
+            cols.append(j)
+            weights.append(weight)
+    if not rows:
+        raise ValueError(f"The edge list {path} contains no edge")
+    rows, cols, weights = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(weights)
+    if D is None:
+        D = int(max(rows.max(), cols.max())) + 1
+    elif max(rows.max(), cols.max()) >= D:
+        raise ValueError(f"The edge list {path} refers to deme {max(rows.max(), cols.max())} but there are only {D} demes")
+    return neighbour_matrix(rows, cols, weights, D, m)
@@ -0,0 +1,223 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+import numpy as np
+from .base import simulation
+
+class genotype_population(simulation):
+    '''
+    This class is used to simulate a population individual by individual.
+    The genotypes are stored in a uint8 array (1 for the allele A, 0 for B) of shape (deme, individual), so an individual
+    takes one byte. Each individual of the next generation copies the genotype of a random parent of its deme, or of a random
+    individual of another deme with the probability of migration.
+    '''
+    __slots__ = ('size', 'p', 'demes', 'migration', 'rng', 'generation', 'genotypes', 'fitness', 'fitness_list')
+
+    def __init__(self, size : int, p : float, demes : int = 1, migration : float = 0.0, rng : np.random.Generator = None):
+        '''
+        This function initialize the parameters of the population from generation 0
+        ----------------
+        parameters
+        size: int -> the size of the population, divided in demes of size size // demes
+        p: float -> the probability of having the genotype A
+        demes: int -> the number of subpopulations
+        migration: float -> the probability that the parent of an individual comes from another deme
+        rng: np.random.Generator -> the random generator (a new one if None)
+        '''
+        self.size = size #size of the population
+        self.p = p #probability of having the allele A
+        self.demes = demes #number of subpopulations
+        self.migration = migration if demes > 1 else 0.0 #migration rate
+        self.rng = np.random.default_rng() if rng is None else rng #random generator
+        self.generation = 0 #number of the generation
+        self.genotypes = (self.rng.random((demes, size // demes)) < p).astype(np.uint8) #genotype of each individual of each deme
+        self.fitness = self.get_fitness() #fitness of each deme
+        self.fitness_list = [self.fitness] #list of the fitness of the demes
+
+    def get_fitness(self) -> np.ndarray: #get the frequency of A in each deme
+        return self.genotypes.mean(axis=1)
+
+    #create new generation from the last one
+    def next_generation(self):
+        '''
+        This function create the next generation from the last one
+        '''
+        D, n = self.genotypes.shape
+        demes = np.repeat(np.arange(D)[:,None], n, axis=1) #deme of the parent of each individual
+        if self.migration > 0:
+            migrants = self.rng.random((D, n)) < self.migration
+            demes[migrants] = (demes[migrants] + self.rng.integers(1, D, np.count_nonzero(migrants))) % D #any other deme
+        self.genotypes = self.genotypes[demes, self.rng.integers(0, n, (D, n))] #copy the genotype of the parents
+        self.fitness = self.get_fitness() #get the fitness of the demes
+        self.fitness_list.append(self.fitness) #add the fitness to the fitness list
+        self.generation += 1 #add 1 to the generation number
+
+    def get_generation(self) -> int: #get the generation number
+        return self.generation
+
+    def get_fitness_list(self) -> np.ndarray: #get the frequency of A in each deme at each generation, shape (generation, deme)
+        return np.array(self.fitness_list)
+
+    def get_genotypes(self) -> np.ndarray: #get the genotype of each individual, shape (deme, individual)
+        return self.genotypes
+
+    def get_count(self) -> int: #get the number of individuals with the allele A
+        return int(np.count_nonzero(self.genotypes))
+
+    def is_absorbed(self) -> bool: #check if the allele A is fixed or lost in every deme (in the whole population with migration)
+        if self.migration > 0:
+            return self.get_count() in (0, self.genotypes.size)
+        return bool(np.all((self.fitness == 0) | (self.fitness == 1)))
+
+class count_population(simulation):
+    '''
+    This class is used to simulate a population by its number of individuals with the allele A only.
+    The next generation is drawn with one binomial sample, so the cost of a generation does not depend on the size.
+    '''
+    __slots__ = ('size', 'p', 'rng', 'generation', 'count', 'fitness', 'fitness_list')
+
+    def __init__(self, size : int, p : float, rng : np.random.Generator = None):
+        '''
+        This function initialize the parameters of the population from generation 0
+        ----------------
+        parameters
+        size: int -> the size of the population
+        p: float -> the probability of having the genotype A
+        rng: np.random.Generator -> the random generator (a new one if None)
+        '''
+        self.size = size #size of the population
+        self.p = p #probability of having the allele A
+        self.rng = np.random.default_rng() if rng is None else rng #random generator
+        self.generation = 0 #number of the generation
+        self.count = int(self.rng.binomial(self.size, self.p)) #number of individuals with the allele A
+        self.fitness = self.get_fitness() #fitness of the population
+        self.fitness_list = [self.fitness] #list of the fitness of the population
+
+    def get_fitness(self) -> float: #get the fitness of the population
+        return self.count / self.size
+
+    #create new generation from the last one
+    def next_generation(self):
+        '''
+        This function create the next generation from the last one.
+        Each individual of the new generation picks its parent uniformly, so the number of A is Binomial(size, fitness)
+        '''
+        self.count = int(self.rng.binomial(self.size, self.fitness)) #draw the new number of A
+        self.fitness = self.get_fitness() #get the fitness of the population
+        self.fitness_list.append(self.fitness) #add the fitness to the fitness list
+        self.generation += 1 #add 1 to the generation number
+
+    def get_generation(self) -> int: #get the generation number
+        return self.generation
+
+    def get_fitness_list(self) -> list: #get the fitness list
+        return self.fitness_list
+
+    def get_count(self) -> int: #get the number of individuals with the allele A
+        return self.count
+
+    def is_absorbed(self) -> bool: #check if the allele A is fixed or lost
+        return self.count in (0, self.size)
+
+class ensemble_population(simulation):
+    '''
+    This class is used to simulate many populations together, one for each (p, simulation) pair.
+    The state is a 2-D array of the number of individuals with the allele A, advanced one generation at a time.
+    A population is retired as soon as the allele A is fixed or lost, its trajectory is padded only when it is read.
+    '''
+    __slots__ = ('size', 'ps', 'nb_simulations', 'rng', 'generation', 'horizon', 'dtype', 'counts', 'trajectories', 'absorption', 'active')
+
+    def __init__(self, size : int, ps : list, nb_simulations : int, generations : int, rng : np.random.Generator = None, store : bool = True):
+        '''
+        This function initialize the parameters of the populations from generation 0
+        ----------------
+        parameters
+        size: int -> the size of each population
+        ps: list -> the probabilities of having the genotype A, one row of populations for each
+        nb_simulations: int -> the number of populations for each probability
+        generations: int -> the number of generations to store in the trajectories
+        rng: np.random.Generator -> the random generator (a new one if None)
+        store: bool -> store the trajectories (False when only the absorption and the final counts are used)
+        '''
+        self.size = size #size of each population
+        self.ps = np.asarray(ps, dtype=float) #probabilities of having the allele A
+        self.nb_simulations = nb_simulations #number of populations for each probability
+        self.rng = np.random.default_rng() if rng is None else rng #random generator
+        self.generation = 0 #number of the generation
+        self.horizon = generations #last generation that can be created
+        self.dtype = np.min_scalar_type(self.size) #smallest integer type able to store a count
+        self.counts = self.rng.binomial(self.size, np.repeat(self.ps[:,None], self.nb_simulations, axis=1)) #number of A of each population
+        self.trajectories = None #number of A of each population at each generation (None if not stored)
+        if store:
+            self.trajectories = np.zeros((generations+1, len(self.ps), self.nb_simulations), dtype=self.dtype)
+            self.trajectories[0] = self.counts
+        self.absorption = np.where((self.counts == 0) | (self.counts == self.size), 0, -1) #generation of fixation or loss of A, -1 if not absorbed
+        self.active = np.flatnonzero(self.absorption == -1) #flat indices of the populations not absorbed
+
+    #create new generation from the last one
+    def next_generation(self):
+        '''
+        This function create the next generation of every active population from the last one with one binomial draw
+        '''
+        counts = self.rng.binomial(self.size, self.counts.flat[self.active] / self.size) #draw the new numbers of A
+        self.generation += 1 #add 1 to the generation number
+        self.counts.flat[self.active] = counts
+        if self.trajectories is not None:
+            self.trajectories[self.generation].flat[self.active] = counts #store the new numbers of A
+
+        absorbed = (counts == 0) | (counts == self.size) #populations absorbed at this generation
+        self.absorption.flat[self.active[absorbed]] = self.generation
+        self.active = self.active[~absorbed] #retire the absorbed populations
+
+    def get_generation(self) -> int: #get the generation number
+        return self.generation
+
+    def get_counts(self) -> np.ndarray: #get the number of A of each population, shape (p, simulation)
+        return self.counts
+
+    def is_absorbed(self) -> bool: #check if the allele A is fixed or lost in every population
+        return len(self.active) == 0
+
+    def get_capacity(self) -> int: #get the number of generations that can still be stored
+        return self.horizon - self.generation
+
+    def get_absorption(self) -> np.ndarray: #get the generation of fixation or loss of each population, -1 if not absorbed
+        return self.absorption
+
+    def get_count_list(self, generations : int = None) -> np.ndarray:
+        '''
+        Get the number of A of each population without copying the trajectories: the trajectories of the absorbed
+        populations are padded in place with their final value, one probability at a time
+        -----------------
+        parameter
+        generations: int -> the last generation of the trajectories (the current one if None)
+        -----------------
+        output
+        count_list: np.ndarray -> a view of the number of A of each population, shape (p, simulation, generation)
+        '''
+        if self.trajectories is None:
+            raise ValueError("the trajectories are not stored (store=False)")
+        generations = self.generation if generations is None else generations
+        steps = np.arange(generations+1)[:,None]
+        for j in range(len(self.ps)):
+            padded = (self.absorption[j] != -1) & (steps > self.absorption[j]) #generations after the absorption, shape (generation, simulation)
+            np.copyto(self.trajectories[:generations+1, j], self.counts[j].astype(self.dtype), where=padded)
+        return self.trajectories[:generations+1].transpose(1, 2, 0)
+
+    def get_fitness_list(self, generations : int = None) -> np.ndarray:
+        '''
+        Get the fitness of each population, the trajectories of the absorbed populations are padded with their final value
+        -----------------
+        parameter
+        generations: int -> the last generation of the trajectories (the current one if None)
+        -----------------
+        output
+        fitness_list: np.ndarray -> the fitness of each population, shape (p, simulation, generation)
+        '''
+        return self.get_count_list(generations) / self.size
+
+    def get_fixation(self) -> np.ndarray: #get the fraction of populations with more A than B for each p
+        return (self.counts > self.size - self.counts).mean(axis=1)
@@ -0,0 +1,40 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+import numpy as np
+
+def crossing_times(system, y0, t_end, param, allele, thresholds, stop=False, method='RK45', jac=None) :
+    '''
+    Integrate a system with an adaptive step and find when the frequency of an allele crosses some thresholds
+    -----------------
+    parameters
+    system: function -> the function associated with the system, system(Z, t, param)
+    y0: list -> the initial values of the system
+    t_end: float -> the end of the integration
+    param: the parameters of the system
+    allele: int -> the index of the allele
+    thresholds: list -> the frequencies of the allele to detect
+    stop: bool -> stop the integration when the frequency crosses the last threshold
+    method: str -> the solver of solve_ivp
+    jac: function -> the Jacobian of the system, jac(Z, t, param) (None to approximate it)
+    -----------------
+    output
+    result: dict -> 'times': the first time the frequency crosses each threshold (nan if never),
+                    't': the end of the integration, 'y': the final frequencies, 'nfev': the number of evaluations of the system
+    '''
+    from scipy.integrate import solve_ivp
+    def threshold_event(threshold) : # The event of a crossing of a threshold
+        def event(t, Z) :
+            return Z[allele]/sum(Z) - threshold
+        return event
+    events = [threshold_event(threshold) for threshold in thresholds]
+    events[-1].terminal = stop
+
+    solution = solve_ivp(lambda t, Z: system(Z, t, param), (0.0, t_end), y0, method=method, events=events, rtol=1e-8, atol=1e-10,
+                         **({} if jac is None else {'jac' : lambda t, Z: jac(Z, t, param)}))
+    times = [t_events[0] if len(t_events) else np.nan for t_events in solution.t_events]
+    y = solution.y[:, -1]
+    return {'times' : np.array(times), 't' : solution.t[-1], 'y' : y/np.sum(y), 'nfev' : solution.nfev}
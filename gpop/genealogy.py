@@ -0,0 +1,172 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+import numpy as np
+from .base import simulation
+
+class genealogy_population(simulation):
+    '''
+    This class is used to create a population of individuals.
+    The recent genealogy is stored as a table of parents: one row per generation, the row of the generation g gives for each
+    individual of the generation g the index of its parent in the generation g-1. The rows are stored in chunks of int32 arrays.
+    The older genealogy is stored as a simplified tree (see simplify) whose samples are the individuals of the generation base,
+    the first generation of the table.
+    The founder (ancestor at generation 0) of each individual is updated at each generation from the draw of the parents.
+    The population is absorbed when all the individuals descend from a single founder.
+    '''
+    __slots__ = ('size', 'chunk', 'simplify_interval', 'rng', 'generation', 'chunks', 'base',
+                 'tree_parent', 'tree_time', 'tree_index', 'tree_samples', 'founders')
+
+    def __init__(self, size : int, chunk : int = 1024, simplify_interval : int = 0, rng : np.random.Generator = None):
+        '''
+        This function initialize the parameters of the population from generation 0
+        ----------------
+        parameters
+        size: int -> the size of the population
+        chunk: int -> the number of generations stored in each chunk of the table of parents
+        simplify_interval: int -> the number of generations between two simplifications of the genealogy (0 for never)
+        rng: np.random.Generator -> the random generator (a new one if None)
+        ----------------
+        output
+        self.size: int -> the size of the population
+        self.generation: int -> the number of the generation
+        self.chunks: list -> the chunks of the table of parents
+        self.base: int -> the generation of the samples of the tree, the table starts after it
+        self.tree_parent, self.tree_time, self.tree_index: np.ndarray -> the parent node, generation and index in its generation of each node of the tree
+        self.tree_samples: np.ndarray -> the node of each individual of the generation base
+        self.founders: np.ndarray -> the index of the founder of each individual
+        '''
+        self.size = size #size of the population
+        self.chunk = chunk #number of generations in each chunk of the table of parents
+        self.simplify_interval = simplify_interval #number of generations between two simplifications
+        self.rng = np.random.default_rng() if rng is None else rng #random generator
+        self.generation = 0 #number of the generation
+        self.chunks = [] #chunks of the table of parents
+        self.base = 0 #generation of the samples of the tree
+        self.tree_parent = np.full(self.size, -1, dtype=np.int64) #the tree starts with the founders
+        self.tree_time = np.zeros(self.size, dtype=np.int64)
+        self.tree_index = np.arange(self.size, dtype=np.int64)
+        self.tree_samples = np.arange(self.size, dtype=np.int64)
+        self.founders = np.arange(self.size, dtype=np.int32) #founder of each individual
+
+    #create new generation from the last one
+    def next_generation(self):
+        '''
+        This function create the next generation from the last one
+        '''
+        row = self.generation - self.base #row of the new generation in the table of parents
+        if row % self.chunk == 0: #the last chunk is full
+            self.chunks.append(np.empty((self.chunk, self.size), dtype=np.int32))
+        parents = self.rng.integers(0, self.size, self.size) #parent of each individual of the new generation
+        self.chunks[-1][row % self.chunk] = parents
+        self.founders = self.founders[parents] #the individuals inherit the founder of their parent
+        self.generation += 1 #add 1 to the generation number
+        if self.simplify_interval and self.generation - self.base >= self.simplify_interval:
+            self.simplify()
+
+    def get_generation(self) -> int: #get the generation number
+        return self.generation
+
+    def get_founders(self) -> np.ndarray: #get the founder of each individual
+        return self.founders
+
+    def get_nb_founders(self) -> int: #get the number of founders with descendants in the population
+        return np.count_nonzero(np.bincount(self.founders, minlength=self.size))
+
+    def is_absorbed(self) -> bool: #check if all the individuals descend from a single founder
+        return self.get_nb_founders() == 1
+
+    def get_population(self) -> np.ndarray: #get the individuals of the population, identified by their index
+        return np.arange(self.size)
+
+    def get_parents(self, generation : int) -> np.ndarray: #get the parent in the previous generation of each individual of a generation after base
+        row = generation - self.base - 1
+        return self.chunks[row // self.chunk][row % self.chunk]
+
+    def get_ancestors(self, group : list = None) -> np.ndarray:
+        '''
+        Get the ancestors of a group of individuals since the generation base by walking the table of parents
+        -----------------
+        parameter
+        group: list -> the indices of the individuals (the whole population if None)
+        -----------------
+        output
+        ancestors: np.ndarray -> ancestors[j, g] is the index of the ancestor of the individual j at generation base + g
+        '''
+        lineages = self.get_population() if group is None else np.asarray(group)
+        ancestors = np.empty((len(lineages), self.generation - self.base), dtype=np.int32)
+        for g in reversed(range(self.base, self.generation)):
+            lineages = self.get_parents(g+1)[lineages]
+            ancestors[:, g - self.base] = lineages
+        return ancestors
+
+    def get_genealogy(self) -> dict:
+        '''
+        Get the genealogy as a table of nodes: the nodes of the tree followed by one node for each individual of each generation of the table
+        -----------------
+        output
+        genealogy: dict -> 'parent', 'time', 'index': the parent node (-1 for a root), generation and index in its generation of each node
+                           'samples': the node of each individual of the current generation
+        '''
+        nb_tree = len(self.tree_parent) #number of nodes of the tree
+        rows = self.generation - self.base #number of generations of the table
+        parent = [self.tree_parent]
+        for row in range(rows):
+            parents = self.get_parents(self.base + row + 1)
+            parent.append(self.tree_samples[parents] if row == 0 else nb_tree + (row-1)*self.size + parents.astype(np.int64))
+        time = np.concatenate([self.tree_time, np.repeat(np.arange(self.base+1, self.generation+1), self.size)])
+        index = np.concatenate([self.tree_index, np.tile(np.arange(self.size), rows)])
+        samples = self.tree_samples if rows == 0 else nb_tree + (rows-1)*self.size + np.arange(self.size)
+        return {'parent' : np.concatenate(parent), 'time' : time, 'index' : index, 'samples' : samples}
+
+    def simplify(self):
+        '''
+        This function replaces the whole genealogy by its simplified tree (see simplify_genealogy), the table of parents is emptied
+        '''
+        tree = simplify_genealogy(**self.get_genealogy())
+        self.tree_parent, self.tree_time, self.tree_index, self.tree_samples = tree['parent'], tree['time'], tree['index'], tree['samples']
+        self.base = self.generation
+        self.chunks = []
+
+def simplify_genealogy(parent : np.ndarray, time : np.ndarray, index : np.ndarray, samples : np.ndarray) -> dict:
+    '''
+    Simplify a genealogy: the nodes without descendants in the samples are pruned and the nodes with only one child
+    are collapsed, so only the samples and their coalescent events are kept (at most 2*len(samples)-1 nodes)
+    -----------------
+    parameters
+    parent: np.ndarray -> the parent node of each node (-1 for a root)
+    time: np.ndarray -> the generation of each node
+    index: np.ndarray -> the index of each node in its generation
+    samples: np.ndarray -> the nodes to keep, they must be distinct
+    -----------------
+    output
+    genealogy: dict -> 'parent', 'time', 'index': the simplified genealogy, 'samples': the new node of each sample
+    '''
+    retained = np.zeros(len(parent), dtype=bool) #ancestors of the samples
+    retained[samples] = True
+    frontier = samples
+    while len(frontier): #walk up the lineages of the samples
+        frontier = np.unique(parent[frontier])
+        frontier = frontier[frontier != -1]
+        frontier = frontier[~retained[frontier]]
+        retained[frontier] = True
+
+    children = np.bincount(parent[retained & (parent != -1)], minlength=len(parent)) #number of retained children of each node
+    kept = retained & (children >= 2) #coalescent events
+    kept[samples] = True
+
+    ancestor = parent.copy() #nearest kept ancestor of each node, found by pointer jumping
+    while True:
+        jump = (ancestor != -1) & retained
+        jump[jump] = ~kept[ancestor[jump]]
+        if not jump.any():
+            break
+        ancestor[jump] = ancestor[ancestor[jump]]
+
+    nodes = np.flatnonzero(kept)
+    new_node = np.full(len(parent), -1, dtype=np.int64)
+    new_node[nodes] = np.arange(len(nodes))
+    return {'parent' : np.where(ancestor[nodes] == -1, -1, new_node[ancestor[nodes]]), 'time' : time[nodes], 'index' : index[nodes], 'samples' : new_node[samples]}
@@ -0,0 +1,105 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+import sys
+from time import perf_counter
+
+class progress():
+    '''
+    This class is used to report the progress of a simulation at a throttled time interval.
+    The simulation calls the progress (bar(n)) with the number of units (generations...) done since the last call.
+    The clock is only read once the number of units reaches the next checkpoint, whose distance is adapted to the
+    measured rate so that the clock is read about 10 times per interval: a call costs one addition and one comparison.
+    A report gives the number of units done, the rate in units per second and the estimated time remaining (ETA).
+    '''
+    __slots__ = ('total', 'title', 'interval', 'enabled', 'file', 'count', 'start', 'last_report', 'next_check', 'step', 'rate')
+
+    def __init__(self, total : int, title : str = '', interval : float = 1.0, file = None):
+        '''
+        This function initialize the progress
+        ----------------
+        parameters
+        total: int -> the total number of units
+        title: str -> the title printed before each report
+        interval: float -> the number of seconds between two reports (0 to disable the reports)
+        file: the stream of the reports (sys.stderr if None)
+        '''
+        self.total = total #total number of units
+        self.title = title #title of the reports
+        self.interval = interval #seconds between two reports
+        self.enabled = interval > 0 #no report at all if disabled
+        self.file = sys.stderr if file is None else file #stream of the reports
+        self.count = 0 #number of units done
+        self.start = perf_counter() #time of the start
+        self.last_report = self.start #time of the last report
+        self.next_check = 1 #number of units at which the clock is read next
+        self.step = 1 #number of units between two readings of the clock
+        self.rate = 0.0 #units per second since the start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __call__(self, n : int = 1):
+        '''
+        Add n units done, the clock is only read when the next checkpoint is reached
+        '''
+        self.count += n
+        if self.count >= self.next_check:
+            self.check()
+
+    def check(self):
+        '''
+        Read the clock, adapt the distance to the next checkpoint and print a report if the interval has elapsed
+        '''
+        now = perf_counter()
+        if now > self.start:
+            self.rate = self.count / (now - self.start)
+        if self.enabled: #about 10 readings of the clock per interval, at most doubling the distance each time
+            self.step = max(1, min(2 * self.step, int(self.rate * self.interval / 10)))
+        else:
+            self.step = max(1, self.total) #no report: the rate is only updated at the end
+        self.next_check = self.count + self.step
+        if self.enabled and now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def get_rate(self) -> float: #get the number of units per second since the start
+        return self.rate
+
+    def get_eta(self) -> float: #get the estimated number of seconds remaining
+        return (self.total - self.count) / self.rate if self.rate > 0 else float('inf')
+
+    def get_batch(self) -> int: #get the number of units to do before the next reading of the clock
+        return max(1, self.next_check - self.count)
+
+    def report(self):
+        '''
+        Print the number of units done, the rate and the estimated time remaining
+        '''
+        percent = 100 * self.count / self.total if self.total else 100.0
+        eta = self.get_eta()
+        eta = f"{eta:.1f}s" if eta != float('inf') else "?"
+        line = f"{self.title} {self.count}/{self.total} [{percent:.0f}%] {self.rate:.4g}/s, ETA {eta}"
+        if self.file.isatty():
+            print(f"\r{line}\033[K", end='', file=self.file, flush=True)
+        else:
+            print(line, file=self.file, flush=True)
+
+    def close(self):
+        '''
+        Print the final report: the number of units done, the total time and the mean rate
+        '''
+        now = perf_counter()
+        if now > self.start:
+            self.rate = self.count / (now - self.start)
+        if self.enabled:
+            if self.file.isatty():
+                print("\r\033[K", end='', file=self.file)
+            print(f"{self.title} {self.count}/{self.total} in {now - self.start:.2f}s ({self.rate:.4g}/s)", file=self.file, flush=True)
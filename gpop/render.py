@@ -0,0 +1,144 @@
+# @coding: utf-8
+# @version: Python 3.8.4
+# @date: 2020-11-23
+# @author: bastien camillo
+# @project: GPOP - Genetic Population
+
+'''
+Rendering of many trajectories on a matplotlib axes. The trajectories are aggregated before drawing, so the time to draw
+and save the figure depends on the number of columns of pixels of the axes, not on the number of trajectories:
+- density: 2-D histogram (generation x frequency) of the trajectories drawn as one image
+- quantiles: quantile bands of the trajectories at each column
+- collection: one LineCollection of the trajectories downsampled to the number of columns
+matplotlib is only imported when a figure is drawn.
+'''
+
+import numpy as np
+
+RENDERS = ('lines', 'density', 'quantiles', 'collection')
+
+def get_nb_columns(ax) -> int: #get the number of columns of pixels of an axes
+    return max(1, int(np.ceil(ax.get_window_extent().width)))
+
+def density_histogram(generations : np.ndarray, frequencies : np.ndarray, nb_generations : int, nb_bins : int = 100, nb_columns : int = 1000) -> np.ndarray:
+    '''
+    Count the points (generation, frequency) of trajectories in a 2-D histogram
+    -----------------
+    parameters
+    generations: np.ndarray -> the generation of each point, between 0 and nb_generations-1
+    frequencies: np.ndarray -> the frequency of each point, between 0 and 1
+    nb_generations: int -> the number of generations
+    nb_bins: int -> the number of bins of frequencies
+    nb_columns: int -> the number of columns, the generations are grouped in at most nb_columns columns
+    -----------------
+    output
+    histogram: np.ndarray -> the number of points of each bin of frequencies in each column, shape (bin, column)
+    '''
+    nb_columns = min(nb_columns, nb_generations)
+    columns = np.asarray(generations, dtype=np.int64) * nb_columns // nb_generations
+    bins = np.minimum((np.asarray(frequencies) * nb_bins).astype(np.int64), nb_bins-1)
+    return np.bincount(bins * nb_columns + columns, minlength=nb_bins*nb_columns).reshape(nb_bins, nb_columns)
+
+def plot_density(ax, histogram : np.ndarray, nb_generations : int, cmap : str = 'viridis'):
+    '''
+    Draw a 2-D histogram of trajectories as one image, each column is normalized by its number of points
+    -----------------
+    parameters
+    ax: matplotlib axes -> the axes of the figure
+    histogram: np.ndarray -> the number of points of each bin of frequencies in each column, shape (bin, column)
+    nb_generations: int -> the number of generations
+    cmap: str -> the colormap
+    '''
+    from matplotlib.colors import LogNorm
+    density = histogram / np.maximum(histogram.sum(axis=0), 1)
+    image = ax.imshow(np.ma.masked_equal(density, 0), origin='lower', aspect='auto', extent=[0, nb_generations-1, 0, 1],
+                      cmap=cmap, norm=LogNorm(vmin=max(density[density > 0].min(), 1e-6) if density.any() else 1e-6, vmax=1), interpolation='nearest')
+    ax.figure.colorbar(image, ax=ax, label='Fraction of the trajectories')
+
+def plot_quantiles(ax, trajectories : np.ndarray, quantiles : tuple = (0.05, 0.25, 0.5, 0.75, 0.95), nb_columns : int = None, size : int = 1):
+    '''
+    Draw the quantile bands of trajectories, the outer quantiles around the inner ones and the median as a line
+    -----------------
+    parameters
+    ax: matplotlib axes -> the axes of the figure
+    trajectories: np.ndarray -> the trajectories, shape (trajectory, generation)
+    quantiles: tuple -> the quantiles, in increasing order and symmetric around the median
+    nb_columns: int -> the number of generations where the quantiles are computed (the columns of the axes if None)
+    size: int -> the trajectories are divided by size (numbers of A of populations of this size)
+    '''
+    nb_columns = get_nb_columns(ax) if nb_columns is None else nb_columns
+    generations = np.unique(np.linspace(0, trajectories.shape[1]-1, min(nb_columns, trajectories.shape[1])).astype(int))
+    values = np.quantile(trajectories[:, generations], quantiles, axis=0) / size
+    for k in range(len(quantiles) // 2): #bands from the outer to the inner quantiles
+        ax.fill_between(generations, values[k], values[-k-1], alpha=0.25, color='C0', linewidth=0,
+                        label=f"{int(100*quantiles[k])}%-{int(100*quantiles[-k-1])}%")
+    if len(quantiles) % 2:
+        ax.plot(generations, values[len(quantiles)//2], color='C0', label='median')
+    ax.legend(loc='upper right', fontsize='small')
+
+def plot_collection(ax, segments : list, nb_generations : int, alpha : float = None):
+    '''
+    Draw trajectories as one LineCollection
+    -----------------
+    parameters
+    ax: matplotlib axes -> the axes of the figure
+    segments: list -> the points (generation, frequency) of each trajectory, arrays of shape (point, 2)
+    nb_generations: int -> the number of generations
+    alpha: float -> the transparency of the lines (decreasing with the number of trajectories if None)
+    '''
+    from matplotlib.collections import LineCollection
+    alpha = min(1.0, max(0.02, 10 / max(len(segments), 1))) if alpha is None else alpha
+    collection = LineCollection(segments, colors=[f"C{k % 10}" for k in range(len(segments))], linewidths=0.8, alpha=alpha)
+    ax.add_collection(collection)
+    ax.set_xlim(0, max(nb_generations-1, 1))
+    ax.set_ylim(0, 1)
+
+def downsample(trajectories : np.ndarray, nb_columns : int, size : int = 1) -> list:
+    '''
+    Downsample trajectories of the same length to at most nb_columns points
+    -----------------
+    parameters
+    trajectories: np.ndarray -> the trajectories, shape (trajectory, generation)
+    nb_columns: int -> the maximum number of points of each trajectory
+    size: int -> the trajectories are divided by size (numbers of A of populations of this size)
+    -----------------
+    output
+    segments: list -> the points (generation, frequency) of each trajectory, arrays of shape (point, 2)
+    '''
+    generations = np.unique(np.linspace(0, trajectories.shape[1]-1, min(nb_columns, trajectories.shape[1])).astype(int))
+    points = np.empty((trajectories.shape[0], len(generations), 2))
+    points[:,:,0] = generations
+    points[:,:,1] = trajectories[:, generations] / size
+    return list(points)
+
+def plot_trajectories(ax, trajectories : np.ndarray, render : str = 'lines', nb_bins : int = 100, size : int = 1):
+    '''
+    Draw trajectories of the same length with a rendering mode
+    -----------------
+    parameters
+    ax: matplotlib axes -> the axes of the figure
+    trajectories: np.ndarray -> the trajectories, shape (trajectory, generation)
+    render: str -> 'lines' (one line for each trajectory), 'density', 'quantiles' or 'collection'
+    nb_bins: int -> the number of bins of frequencies of the density
+    size: int -> the trajectories are divided by size, block by block, so integer numbers of A can be drawn without
+                 converting them all to frequencies first
+    '''
+    nb_trajectories, nb_generations = trajectories.shape
+    if render == 'lines':
+        ax.plot(trajectories.T / size)
+    elif render == 'density':
+        nb_columns = get_nb_columns(ax)
+        histogram = 0
+        rows = max(1, 2**20 // nb_generations) #trajectories counted at once
+        for start in range(0, nb_trajectories, rows):
+            block = trajectories[start:start+rows]
+            generations = np.broadcast_to(np.arange(nb_generations), block.shape)
+            histogram = histogram + density_histogram(generations.ravel(), block.ravel() / size, nb_generations, nb_bins, nb_columns)
+        plot_density(ax, histogram, nb_generations)
+    elif render == 'quantiles':
+        plot_quantiles(ax, trajectories, size=size)
+        ax.set_ylim(0, 1)
+    elif render == 'collection':
+        plot_collection(ax, downsample(trajectories, get_nb_columns(ax), size), nb_generations)
+    else:
+        raise ValueError(f"Unknown rendering mode {render}, expected one of {RENDERS}")
@@ -4,132 +4,120 @@
 # @author: bastien camillo
 # @project: GPOP - Genetic Population
 
-import random
-import matplotlib.pyplot as plt
+import numpy as np
 import argparse
-from alive_progress import alive_bar
+from gpop import genotype_population, deme_population, island_matrix, stepping_stone_matrix, load_migration_matrix, grid_matrix, graph_matrix, progress
 
-parser = argparse.ArgumentParser(description='This program simulate the evolution of a population subdivided in 10 subpopulations without migration')
-parser.add_argument('-s', '--size', type=int, default=1000, help='size of the non subdivided population')
-parser.add_argument('-p', '--p', type=float, default=0.5, help='probability of having the allele A')
-parser.add_argument('-m', '--migration', type=float, default=0.1, help='migration rate')
-parser.add_argument('-g', '--generations', type=int, default=1000, help='number of generations')
-args = parser.parse_args()
-
-size = args.size
-p = args.p
-migration = args.migration
-generations = args.generations
-
-class population():
+def get_parser() -> argparse.ArgumentParser:
     '''
-    This class is used to create a population of individuals
+    Get the parser of the arguments of the program
     '''
-    def __init__(self, size : int, p : float):
-        '''
-        This function initialize the parameters of the population from generation 0
-        ----------------
-        parameters
-        size: int -> the size of the population
-        p: float -> the probability of having the genotype A
-        '''
-        self.size = size #size of the population
-        self.p = p #probability of having the allele A
-        self.generation = 0 #number of the generation
-        self.fitness = [] #fitness of the population
-        self.fitness_list = {f"{int(i)}":[] for i in range(10)} #list of the fitness of the population
-        self.population = [self.get_individual() for i in range(self.size)] #create the population
-        self.subpopulations = [self.population[i:i+int(self.size/10)] for i in range(0, self.size, int(self.size/10))]
-        self.fitness = self.get_fitness() #get the fitness of the population
-        self.get_fitness_list() #add the fitness to the fitness list
-
-    class individual():
-        '''
-        This class is used to create individuals. Each individual has a probability p to have the allele A
-        '''
-        def __init__(self, p : float):
-            '''
-            This function initialize the parameters of the individual
-            ------------------------------------
-            parameter
-            self: the individual
-            p: float -> probability of having the allele A
-            ------------------------------------
-            output
-            self.genotype: the genotype of the individual
-            '''
-            self.p = p #probability of having the allele A
-            self.genotype = 'A' if random.random() < self.p else 'B' #create the genotype of the individual with the probability p
-
-        def get_genotype(self): #get the genotype of the individual
-            return self.genotype
-
-    def get_individual(self) -> individual: #get an individual
-        return self.individual(self.p)
-
-    def get_genotypes_of(self, pos : int) -> list: #get the genotypes of the population in a list
-        return [gen.genotype for gen in self.subpopulations[pos]]
-    
-    def get_genotypes(self) -> list: #get the genotypes of the population in a list
-        return [self.get_genotypes_of(i) for i in range(len(self.subpopulations))] 
-    
-    def get_fitness(self) -> float: #get the fitness of the population
-        return [self.get_genotypes_of(i).count('A') / self.size for i in range(len(self.subpopulations))] 
-    
-    def get_fitness_list(self) -> list:
-        for i in range(len(self.subpopulations)):
-            self.fitness_list[f"{int(i)}"].append(self.fitness[i])
-    
-    #create new generation from the last one
-    def next_generation(self):
-        '''
-        This function create the next generation from the last one
-        '''
-        new_subpopulations = [[] for i in range(len(self.subpopulations))] #create a list of empty subpopulations
-        for i in range(len(self.subpopulations)):
-            for j in range(len(self.subpopulations[i])):
-                if random.random() < migration:
-                    new_subpopulations[i].append(random.choice([item for sublist in self.subpopulations[:i] + self.subpopulations[i+1:] for item in sublist])) #add an individual from another subpopulation
-                else:
-                    new_subpopulations[i].append(random.choice(self.subpopulations[i])) #add an individual from the same subpopulation
-
-        self.subpopulations = new_subpopulations #replace the old subpopulations by the new ones      
-        self.population = [item for sublist in self.subpopulations for item in sublist] #create the new population
-
-        self.fitness = self.get_fitness() #get the fitness of the population
-        self.get_fitness_list() #add the fitness to the fitness list
-        self.generation += 1 #add 1 to the generation number
-
-    def out_generation(self) -> int: #get the generation number
-        return self.generation
-    
-    def out_fitness_list(self) -> list: #get the fitness list
-        return self.fitness_list
-
-    def out_population(self) -> list: #get the population list
-        return self.population
-
-    def out_subpopulations(self) -> list: #get the subpopulations list
-        return self.subpopulations
-
-def main():
-    pop = population(size, p) #create the population
-    with alive_bar(generations) as bar:
-        for i in range(generations): #loop over the generations
-            pop.next_generation() #create the next generation
-            bar()
-
+    parser = argparse.ArgumentParser(description='This program simulate the evolution of a population subdivided in 10 subpopulations without migration')
+    parser.add_argument('-s', '--size', type=int, default=1000, help='size of the non subdivided population')
+    parser.add_argument('-p', '--p', type=float, default=0.5, help='probability of having the allele A')
+    parser.add_argument('-m', '--migration', type=float, default=0.1, help='migration rate')
+    parser.add_argument('-g', '--generations', type=int, default=1000, help='number of generations')
+    parser.add_argument('-D', '--demes', type=int, default=10, help='number of subpopulations')
+    parser.add_argument('-ds', '--deme_sizes', type=int, nargs='+', default=None, help='size of each subpopulation (size/demes for each by default)')
+    parser.add_argument('-model', '--model', choices=['island', 'stepping_stone', 'file', 'grid', 'graph'], default='island', help='Migration model used to build the backward migration matrix')
+    parser.add_argument('-matrix', '--matrix', type=str, default=None, help='File of the backward migration matrix for the file model (.npy, .npz sparse matrix or text)')
+    parser.add_argument('-grid', '--grid', type=int, nargs=2, default=None, metavar=('ROWS', 'COLUMNS'), help='Shape of the 2-D lattice of demes for the grid model (migrants exchanged with the 4 nearest neighbours)')
+    parser.add_argument('-torus', '--torus', action='store_true', help='Wrap the edges of the lattice of the grid model')
+    parser.add_argument('-edges', '--edges', type=str, default=None, help='Edge list file of the graph model: one "i j [weight]" line per undirected edge between demes i and j')
+    parser.add_argument('-memmap', '--memmap', type=str, default=None, help='.npy file where the frequencies of the demes (generation x deme) are written in chunks (kept in memory if None)')
+    parser.add_argument('-chunk', '--chunk', type=int, default=256, help='Number of generations written to the memmap file at once')
+    parser.add_argument('-sparse', '--sparse', action='store_true', help='Store the migration matrix as a sparse matrix')
+    parser.add_argument('-engine', '--engine', choices=['count', 'individual'], default='count', help='Simulation engine: migration matrix on the number of A of each subpopulation (binomial) or genotype of each individual (island model)')
+    parser.add_argument('-no_plot', '--no_plot', '--no-plot', action='store_true', help='Do not draw nor save the figures')
+    parser.add_argument('-progress', '--progress', type=float, default=1.0, help='Seconds between two progress reports (0 to disable them)')
+    return parser
+
+def main(argv : list = None):
+    '''
+    Simulate the subdivided population with migration and plot the frequency of A in the subpopulations
+    -----------------
+    parameter
+    argv: list -> the arguments of the program (those of the command line if None)
+    '''
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    size = args.size
+    p = args.p
+    migration = args.migration
+    generations = args.generations
+
+    if args.engine == 'count':
+        D = args.demes
+        if args.model == 'file':
+            if args.matrix is None:
+                parser.error("-matrix is required with -model file")
+            try:
+                M = load_migration_matrix(args.matrix, args.sparse)
+            except ValueError as error:
+                parser.error(str(error))
+            D = M.shape[0] #the number of demes is given by the matrix
+        elif args.model == 'grid':
+            if args.grid is None:
+                parser.error("-grid is required with -model grid")
+            M = grid_matrix(args.grid[0], args.grid[1], migration, args.torus)
+            D = M.shape[0]
+        elif args.model == 'graph':
+            if args.edges is None:
+                parser.error("-edges is required with -model graph")
+            try:
+                M = graph_matrix(args.edges, migration, len(args.deme_sizes) if args.deme_sizes is not None else None)
+            except ValueError as error:
+                parser.error(str(error))
+            D = M.shape[0]
+        sizes = args.deme_sizes if args.deme_sizes is not None else [size // D] * D #size of each deme
+        if min(sizes) < 1:
+            parser.error(f"the population of size {size} is too small for {D} subpopulations")
+        if args.model == 'island':
+            M = island_matrix(len(sizes), migration, args.sparse)
+        elif args.model == 'stepping_stone':
+            M = stepping_stone_matrix(len(sizes), migration, args.sparse)
+        pop = deme_population(sizes, p, generations, M, path=args.memmap, chunk=args.chunk) #create the population
+    else:
+        pop = genotype_population(size, p, args.demes, migration) #create the population
+    with progress(generations, "Generations", args.progress) as bar:
+        pop.run(generations, bar) #stops early when A is fixed or lost
+
+    fitness_list = pop.get_fitness_list()
+    D = fitness_list.shape[1]
+    last = pop.get_generation() #last generation simulated
+    if args.no_plot:
+        return
+
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(16, 9))
-    for i in range(10):
-        plt.plot(range(generations+1)[1:], pop.fitness_list[f"{int(i)}"][1:], label=f'subpopulation {i+1}')
-    plt.title(f"Frequency of the allele A in the subpopulations over time with migration\nsize: {int(size/10)}, p_ini: {p}, migration rate: {migration}, generations: {generations}")
+    if D <= 100:
+        for i in range(D):
+            plt.plot(range(last+1)[1:], fitness_list[1:, i], label=f'subpopulation {i+1}')
+    else: #mean and 5%-95% quantiles over the subpopulations, read by chunks of generations from the (possibly memory-mapped) history
+        bands = np.concatenate([np.quantile(fitness_list[t:t+args.chunk], [0.05, 0.5, 0.95], axis=1).T for t in range(1, last+1, args.chunk)])
+        mean = np.concatenate([fitness_list[t:t+args.chunk].mean(axis=1) for t in range(1, last+1, args.chunk)])
+        plt.fill_between(range(last+1)[1:], bands[:, 0], bands[:, 2], alpha=0.3, label='5%-95% of the subpopulations')
+        plt.plot(range(last+1)[1:], bands[:, 1], label='median')
+        plt.plot(range(last+1)[1:], mean, label='mean')
+        plt.legend()
+    plt.title(f"Frequency of the allele A in the subpopulations over time with migration\nsize: {int(size/D)}, p_ini: {p}, migration rate: {migration}, generations: {generations}")
     plt.xlabel('Generation')
     plt.ylabel('Frequency of allele A')
-    plt.legend()
+    if D <= 10:
+        plt.legend()
     plt.grid()
     plt.tight_layout()
     plt.savefig(f"population_structure_+m_{size}_{p}_{generations}.png")
     plt.show()
 
+    if args.engine == 'count' and args.model == 'grid': #map of the frequencies on the lattice at the last generation
+        plt.figure(figsize=(10, 9))
+        plt.imshow(np.asarray(fitness_list[-1]).reshape(args.grid), vmin=0, vmax=1, cmap='viridis')
+        plt.colorbar(label='Frequency of allele A')
+        plt.title(f"Frequency of the allele A on the lattice at generation {last}\nmigration rate: {migration}")
+        plt.tight_layout()
+        plt.savefig(f"population_structure_grid_{args.grid[0]}x{args.grid[1]}_{p}_{generations}.png")
+        plt.show()
+
 if __name__ == '__main__':
     main()
@@ -4,99 +4,212 @@
 # @author: bastien camillo
 # @project: GPOP - Genetic Population
 
-import random
-import matplotlib.pyplot as plt
+import numpy as np
 import argparse
-from alive_progress import alive_bar
-import pandas as pd
 from math import sqrt
+from multiprocessing import Pool, shared_memory
+from gpop import allele_history, diversity_statistics, allele_population, allele_count_population
+from gpop.render import get_nb_columns, density_histogram, plot_density, plot_collection
 
-parser = argparse.ArgumentParser(description="This script simulate the evolution of a population with mutations")
-parser.add_argument('-sim', '--sim', type=int, default=10, help='Number of simulations')
-parser.add_argument('-size', '--size', type=int, default=100, help='Size of the population')
-parser.add_argument('-mut', '--mutation_rate', type=float, default=0.01, help='Mutation rate')
-parser.add_argument('-gen', '--gen', type=int, default=1000, help='Number of generations')
-args = parser.parse_args() # parse the arguments
+def get_parser() -> argparse.ArgumentParser:
+    '''
+    Get the parser of the arguments of the program
+    '''
+    parser = argparse.ArgumentParser(description="This script simulate the evolution of a population with mutations")
+    parser.add_argument('-sim', '--sim', type=int, default=10, help='Number of simulations')
+    parser.add_argument('-size', '--size', type=int, default=100, help='Size of the population')
+    parser.add_argument('-mut', '--mutation_rate', type=float, default=0.01, help='Mutation rate')
+    parser.add_argument('-gen', '--gen', type=int, default=1000, help='Number of generations')
+    parser.add_argument('-history', '--history', type=str, default=None, help='Prefix of the .npz files where the allele frequency history is streamed (kept in memory if None)')
+    parser.add_argument('-chunk', '--chunk', type=int, default=1000, help='Number of generations of the history in each chunk')
+    parser.add_argument('-auto_stop', '--auto_stop', action='store_true', help='Stop a simulation once the homozygosity is at the mutation-drift equilibrium')
+    parser.add_argument('-window', '--window', type=int, default=100, help='Number of generations of the running means of the equilibrium detector')
+    parser.add_argument('-tolerance', '--tolerance', type=float, default=0.05, help='Relative tolerance between the running mean of the homozygosity and its expectation')
+    parser.add_argument('-workers', '--workers', type=int, default=0, help='Number of processes running the simulations with the count engine (0 to run them in this process and plot the alleles)')
+    parser.add_argument('-seed', '--seed', type=int, default=None, help='Master seed of the random generators of the simulations')
+    parser.add_argument('-engine', '--engine', choices=['count', 'individual'], default='count', help='Simulation engine: allele counts (multinomial) or allele of each individual')
+    parser.add_argument('-no_plot', '--no_plot', '--no-plot', action='store_true', help='Do not draw nor save the figure')
+    parser.add_argument('-render', '--render', choices=['lines', 'density', 'collection'], default='lines', help='Rendering of the alleles: one line each, density histogram or one downsampled LineCollection')
+    return parser
 
-simu = args.sim
-size = args.size
-mutation_rate = args.mutation_rate
-gen = args.gen
+def print_summary(sim : int, generation : int, summary : dict, expected : float):
+    '''
+    Print the diversity statistics of a simulation
+    -----------------
+    parameters
+    sim: int -> the number of the simulation
+    generation: int -> the last generation of the simulation
+    summary: dict -> the statistics, as returned by diversity_statistics.get_summary
+    expected: float -> the homozygosity at the mutation-drift equilibrium
+    '''
+    print(f"Simulation {sim+1}: generation {generation}, F = {summary['homozygosity']:.4f} (mean {summary['mean_homozygosity']:.4f}, expected {expected:.4f}), "
+          f"K = {summary['nb_alleles']} (mean {summary['mean_nb_alleles']:.1f}), theta_F = {summary['theta_F']:.3f}, theta_K = {summary['theta_K']:.3f}, F expected from theta_K = {summary['expected_homozygosity_K']:.4f}")
 
-class population():
+def run_replicate(sim : int, seed : np.random.SeedSequence, size : int, µ : float, generations : int, window : int, tolerance : float,
+                  auto_stop : bool, path : str, chunk : int, buffer : str, simu : int) -> tuple:
     '''
-    This class is used to create a population of individuals
+    Run one simulation with the count engine in a worker process.
+    The homozygosity and the number of alleles of each generation are written in the row sim of a shared array
+    of shape (simulation, 2, generation), the generations after an automatic stop stay NaN.
+    -----------------
+    parameters
+    sim: int -> the number of the simulation
+    seed: np.random.SeedSequence -> the seed of the random generator of the simulation
+    size, µ, generations: the size of the population, the mutation rate and the maximum number of generations
+    window, tolerance, auto_stop: the parameters of the equilibrium detector
+    path, chunk: the prefix of the files of the history (None to not save it) and the number of generations of its chunks
+    buffer: str -> the name of the shared memory of the results
+    simu: int -> the number of simulations (rows of the shared array)
+    -----------------
+    output
+    result: tuple -> the number of the simulation, its last generation and its summary statistics
     '''
-    def __init__(self, size : int, µ : float):
-        '''
-        This function initialize the parameters of the population from generation 0
-        ----------------
-        parameters
-        size: int -> the size of the population
-        µ: float -> mutation rate
-        '''
-        self.size = size #size of the population
-        self.generation = 0 #number of the generation
-        self.population = [] #list of the individuals of the population
-        self.fitness = {} #fitness of the population
-        self.fitness_list = [] #list of the fitness of the population
-        self.mutation_rate = µ #mutation rate
-        self.population = [int(0) for i in range(self.size)] #create the population
+    statistics = diversity_statistics(size, µ, window, tolerance)
+    pop = allele_count_population(size, µ, history=allele_history(size, path, chunk), statistics=statistics, rng=np.random.default_rng(seed))
+    for j in range(generations):
+        pop.next_generation()
+        if auto_stop and statistics.is_at_equilibrium(): #stop at the mutation-drift equilibrium
+            break
+    pop.get_fitness_list().flush()
+
+    memory = shared_memory.SharedMemory(name=buffer)
+    try:
+        results = np.ndarray((simu, 2, generations), dtype=np.float64, buffer=memory.buf)
+        results[sim, 0, :pop.get_generation()] = statistics.homozygosity
+        results[sim, 1, :pop.get_generation()] = statistics.nb_alleles
+        del results
+    finally:
+        memory.close()
+    return sim, pop.get_generation(), statistics.get_summary()
 
-    def get_fitness(self) -> float: #get the fitness of the population
-        dic = {}
-        for k in self.population:
-            if f"{k}" not in dic :
-                dic[f"{k}"] = self.population.count(k)/self.size
-        return dic
+def run_parallel(args : argparse.Namespace, seeds : list) -> np.ndarray:
+    '''
+    Run the simulations with the count engine in a pool of processes.
+    Each simulation has its own random generator, so the results do not depend on the number of processes.
+    -----------------
+    parameters
+    args: argparse.Namespace -> the arguments of the program
+    seeds: list -> the seed of the random generator of each simulation
+    -----------------
+    output
+    results: np.ndarray -> the homozygosity and the number of alleles of each simulation at each generation, shape (simulation, 2, generation)
+    '''
+    simu, size, mutation_rate, gen = args.sim, args.size, args.mutation_rate, args.gen
+    memory = shared_memory.SharedMemory(create=True, size=max(1, 16*simu*gen)) #homozygosity and number of alleles of each simulation
+    try:
+        results = np.ndarray((simu, 2, gen), dtype=np.float64, buffer=memory.buf)
+        results[:] = np.nan
+        tasks = [(sim, seeds[sim], size, mutation_rate, gen, args.window, args.tolerance, args.auto_stop,
+                  None if args.history is None else f"{args.history}_{sim+1}", args.chunk, memory.name, simu) for sim in range(simu)]
+        expected = diversity_statistics(size, mutation_rate).get_expected_homozygosity()
+        with Pool(args.workers) as pool:
+            for sim, generation, summary in sorted(pool.starmap(run_replicate, tasks)):
+                print_summary(sim, generation, summary, expected)
 
-    #create new generation from the last one
-    def next_generation(self):
-        '''
-        This function create the next generation from the last one
-        '''
-        #create a new generation        
-        #self.population = [random.choice(self.population) if random.random() < self.mutation_rate else int(max(self.population())+1) for i in range(self.size)]
-        
-        for i in range(self.size):
-            if random.random() < self.mutation_rate:
-                self.population[i] = max(self.population)+1                
-            else:
-                self.population[i] = random.choice(self.population)
-        
-        self.fitness = self.get_fitness() #get the fitness of the population
-        self.fitness_list.append(self.fitness) #add the fitness to the fitness list
-        self.generation += 1 #add 1 to the generation number
+        np.savez(f"Mutations_statistics_{simu}_{size}_{mutation_rate}_{gen}.npz", homozygosity=results[:,0], nb_alleles=results[:,1])
+        copy = results.copy()
+        del results
+    finally: #the shared memory is released even if a worker fails
+        memory.close()
+        memory.unlink()
+    return copy
 
-    def get_generation(self) -> int: #get the generation number
-        return self.generation
-    
-    def get_fitness_list(self) -> list: #get the fitness list
-        return self.fitness_list
+def plot_alleles(ax, history : allele_history, render : str = 'lines'):
+    '''
+    Plot the frequency of each allele of a simulation over its lifetime
+    -----------------
+    parameters
+    ax: matplotlib axes -> the axes of the figure
+    history: allele_history -> the history of the allele counts of the simulation
+    render: str -> 'lines' (one line for each allele), 'density' (2-D histogram of the frequencies of the alleles present
+                   at each generation, counted chunk by chunk) or 'collection' (one LineCollection of the alleles downsampled
+                   to the columns of pixels of the axes)
+    '''
+    nb_generations = max(history.nb_generations, 1)
+    if render == 'density':
+        histogram = 0
+        for chunk in history.get_chunks():
+            generations = chunk['first'] + np.repeat(np.arange(len(chunk['indptr'])-1), np.diff(chunk['indptr']))
+            histogram = histogram + density_histogram(generations, chunk['counts'] / history.size, nb_generations, nb_columns=get_nb_columns(ax))
+        plot_density(ax, histogram, nb_generations)
+        return
+    fitness = history.to_sparse().tocsc()
+    step = max(1, nb_generations // get_nb_columns(ax)) #generations between two points of a downsampled allele
+    segments = []
+    for k in np.flatnonzero(np.diff(fitness.indptr)): #each allele over its lifetime
+        generations = fitness.indices[fitness.indptr[k]:fitness.indptr[k+1]]
+        trajectory = np.zeros(generations[-1] - generations[0] + 1)
+        trajectory[generations - generations[0]] = fitness.data[fitness.indptr[k]:fitness.indptr[k+1]]
+        if render == 'lines':
+            ax.plot(np.arange(generations[0], generations[-1]+1), trajectory)
+        else: #keep one point every step generations and the last one
+            points = np.unique(np.append(np.arange(0, len(trajectory), step), len(trajectory)-1))
+            segments.append(np.column_stack((generations[0] + points, trajectory[points])))
+    if render == 'collection':
+        plot_collection(ax, segments, nb_generations)
 
-    def get_population(self) -> list: #get the population list
-        return self.population
+def main(argv : list = None):
+    '''
+    Run the simulations and plot the alleles of each simulation (or their homozygosity when they run in a pool of processes)
+    -----------------
+    parameter
+    argv: list -> the arguments of the program (those of the command line if None)
+    '''
+    parser = get_parser()
+    args = parser.parse_args(argv) # parse the arguments
+    simu, size, mutation_rate, gen = args.sim, args.size, args.mutation_rate, args.gen
+    if size < 1 or gen < 1:
+        parser.error("the size of the population and the number of generations must be at least 1")
+    if not args.no_plot:
+        import matplotlib.pyplot as plt
+        plt.figure(figsize=(16,9))
+        plt.suptitle("Fitness of the population")
+    seeds = np.random.SeedSequence(args.seed).spawn(simu) #independent random streams of the simulations
+    if args.workers > 0:
+        results = run_parallel(args, seeds)
+        if args.no_plot:
+            return
+        expected = diversity_statistics(size, mutation_rate).get_expected_homozygosity()
+        for sim in range(simu):
+            plt.subplot(int(sqrt(simu)), int(sqrt(simu))+1, sim+1)
+            plt.plot(results[sim, 0], label="F")
+            plt.axhline(expected, color='black', linestyle='--', label="1/(1+2Nµ)")
+            plt.xlabel("Generation")
+            plt.ylabel("Homozygosity")
+            plt.title(f"Simulation {sim+1}")
+        plt.tight_layout()
+        plt.savefig(f"Mutations_{simu}_{size}_{mutation_rate}_{gen}.png", dpi=300)
+        plt.show()
+        return
 
-def main():
-    plt.figure(figsize=(16,9))
-    plt.suptitle("Fitness of the population")
     for sim in range(simu):
-        pop = population(size, mutation_rate) #create the population
+        path = None if args.history is None else f"{args.history}_{sim+1}" #prefix of the files of the history of this simulation
+        statistics = diversity_statistics(size, mutation_rate, args.window, args.tolerance)
+        history = allele_history(size, path, args.chunk)
+        if args.engine == 'count':
+            pop = allele_count_population(size, mutation_rate, history=history, statistics=statistics, rng=np.random.default_rng(seeds[sim])) #create the population
+        else:
+            pop = allele_population(size, mutation_rate, history=history, statistics=statistics, rng=np.random.default_rng(seeds[sim])) #create the population
         for j in range(gen):
             pop.next_generation()  
+            if args.auto_stop and statistics.is_at_equilibrium(): #stop at the mutation-drift equilibrium
+                break
 
-        #get the fitness list
-        fitness_list = pop.get_fitness_list()    
-
-        df = pd.DataFrame(fitness_list)
-        df = df.fillna(0)
+        print_summary(sim, pop.get_generation(), statistics.get_summary(), statistics.get_expected_homozygosity())
 
-        plt.subplot(int(sqrt(simu)), int(sqrt(simu))+1, sim+1)
-        plt.plot(df)
+        #get the history of the allele counts, one sparse column for each allele
+        history = pop.get_fitness_list()
+        history.flush()
+        if args.no_plot:
+            continue
+        ax = plt.subplot(int(sqrt(simu)), int(sqrt(simu))+1, sim+1)
+        plot_alleles(ax, history, args.render)
         plt.xlabel("Generation")
         plt.ylabel("Fitness")
         plt.title(f"Simulation {sim+1}")
 
+    if args.no_plot:
+        return
     plt.tight_layout()
     plt.savefig(f"Mutations_{simu}_{size}_{mutation_rate}_{gen}.png", dpi=300)
     plt.show()
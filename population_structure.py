@@ -4,117 +4,70 @@
 # @author: bastien camillo
 # @project: GPOP - Genetic Population
 
-import random
-import matplotlib.pyplot as plt
+import numpy as np
 import argparse
-from alive_progress import alive_bar
+from gpop import genotype_population, deme_population, progress
 
-parser = argparse.ArgumentParser(description='This program simulate the evolution of a population subdivided in 10 subpopulations without migration')
-parser.add_argument('-s', '--size', type=int, default=1000, help='size of the non subdivided population')
-parser.add_argument('-p', '--p', type=float, default=0.5, help='probability of having the allele A')
-parser.add_argument('-g', '--generations', type=int, default=1000, help='number of generations')
-args = parser.parse_args()
-
-size = args.size
-p = args.p
-generations = args.generations
-
-class population():
+def get_parser() -> argparse.ArgumentParser:
     '''
-    This class is used to create a population of individuals
+    Get the parser of the arguments of the program
     '''
-    def __init__(self, size : int, p : float):
-        '''
-        This function initialize the parameters of the population from generation 0
-        ----------------
-        parameters
-        size: int -> the size of the population
-        p: float -> the probability of having the genotype A
-        '''
-        self.size = size #size of the population
-        self.p = p #probability of having the allele A
-        self.generation = 0 #number of the generation
-        self.fitness = [] #fitness of the population
-        self.fitness_list = {f"{int(i)}":[] for i in range(10)} #list of the fitness of the population
-        self.population = [self.get_individual() for i in range(self.size)] #create the population
-        self.subpopulations = [self.population[i:i+int(self.size/10)] for i in range(0, self.size, int(self.size/10))]
-        self.fitness = self.get_fitness() #get the fitness of the population
-        self.get_fitness_list() #add the fitness to the fitness list
-
-    class individual():
-        '''
-        This class is used to create individuals. Each individual has a probability p to have the allele A
-        '''
-        def __init__(self, p : float):
-            '''
-            This function initialize the parameters of the individual
-            ------------------------------------
-            parameter
-            self: the individual
-            p: float -> probability of having the allele A
-            ------------------------------------
-            output
-            self.genotype: the genotype of the individual
-            '''
-            self.p = p #probability of having the allele A
-            self.genotype = 'A' if random.random() < self.p else 'B' #create the genotype of the individual with the probability p
-
-        def get_genotype(self): #get the genotype of the individual
-            return self.genotype
+    parser = argparse.ArgumentParser(description='This program simulate the evolution of a population subdivided in 10 subpopulations without migration')
+    parser.add_argument('-s', '--size', type=int, default=1000, help='size of the non subdivided population')
+    parser.add_argument('-p', '--p', type=float, default=0.5, help='probability of having the allele A')
+    parser.add_argument('-g', '--generations', type=int, default=1000, help='number of generations')
+    parser.add_argument('-D', '--demes', type=int, default=10, help='number of subpopulations')
+    parser.add_argument('-ds', '--deme_sizes', type=int, nargs='+', default=None, help='size of each subpopulation (size/demes for each by default)')
+    parser.add_argument('-engine', '--engine', choices=['count', 'individual'], default='count', help='Simulation engine: number of A of each subpopulation (binomial) or genotype of each individual')
+    parser.add_argument('-no_plot', '--no_plot', '--no-plot', action='store_true', help='Do not draw nor save the figure')
+    parser.add_argument('-progress', '--progress', type=float, default=1.0, help='Seconds between two progress reports (0 to disable them)')
+    return parser
 
-    def get_individual(self) -> individual: #get an individual
-        return self.individual(self.p)
-
-    def get_genotypes_of(self, pos : int) -> list: #get the genotypes of the population in a list
-        return [i.genotype for i in self.subpopulations[pos]]
-    
-    def get_genotypes(self) -> list: #get the genotypes of the population in a list
-        return [self.get_genotypes_of(i) for i in range(len(self.subpopulations))] 
-    
-    def get_fitness(self) -> float: #get the fitness of the population
-        return [self.get_genotypes_of(i).count('A') / self.size for i in range(len(self.subpopulations))] 
-    
-    def get_fitness_list(self) -> list:
-        for i in range(len(self.subpopulations)):
-            self.fitness_list[f"{int(i)}"].append(self.fitness[i])
-    
-    #create new generation from the last one
-    def next_generation(self):
-        '''
-        This function create the next generation from the last one
-        '''
-        self.subpopulations = [[random.choice(self.subpopulations[j]) for i in range(self.size)] for j in range(len(self.subpopulations))] #create the new subpopulations without migration
-        self.population = [item for sublist in self.subpopulations for item in sublist] #create the new population        
-        self.fitness = self.get_fitness() #get the fitness of the population
-        self.get_fitness_list() #add the fitness to the fitness list
-        self.generation += 1 #add 1 to the generation number
-
-    def out_generation(self) -> int: #get the generation number
-        return self.generation
-    
-    def out_fitness_list(self) -> list: #get the fitness list
-        return self.fitness_list
+def main(argv : list = None):
+    '''
+    Simulate the subdivided population and plot the frequency of A in each subpopulation
+    -----------------
+    parameter
+    argv: list -> the arguments of the program (those of the command line if None)
+    '''
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    size = args.size
+    p = args.p
+    generations = args.generations
 
-    def out_population(self) -> list: #get the population list
-        return self.population
+    sizes = args.deme_sizes if args.deme_sizes is not None and args.engine == 'count' else [size // args.demes] * args.demes #size of each deme
+    if min(sizes) < 1 and args.deme_sizes is not None and args.engine == 'count':
+        parser.error("every subpopulation must contain at least one individual")
+    if min(sizes) < 1:
+        parser.error(f"the population of size {size} is too small for {len(sizes)} subpopulations")
+    if args.engine == 'count':
+        pop = deme_population(sizes, p, generations) #create the population
+    else:
+        pop = genotype_population(size, p, args.demes) #create the population
+    with progress(generations, "Generations", args.progress) as bar:
+        pop.run(generations, bar) #stops early when A is fixed or lost
 
-    def out_subpopulations(self) -> list: #get the subpopulations list
-        return self.subpopulations
+    fitness_list = pop.get_fitness_list()
+    if args.engine == 'count':
+        statistics = pop.get_statistics()
+        if pop.is_absorbed():
+            print(f"All subpopulations absorbed at generation {pop.get_generation()}")
+        print(f"H_S = {statistics[-1, 0]:.4f}, H_T = {statistics[-1, 1]:.4f}, Fst = {statistics[-1, 2]:.4f}")
+        np.savez(f"population_structure_{size}_{p}_{generations}.npz", sizes=pop.sizes, fitness=fitness_list, H_S=statistics[:, 0], H_T=statistics[:, 1], Fst=statistics[:, 2])
 
-def main():
-    pop = population(size, p) #create the population
-    with alive_bar(generations) as bar:
-        for i in range(generations): #loop over the generations
-            pop.next_generation() #create the next generation
-            bar()
+    if args.no_plot:
+        return
 
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(16, 9))
-    for i in range(10):
-        plt.plot(range(generations+1)[1:], pop.fitness_list[f"{int(i)}"][1:], label=f'subpopulation {i+1}')
+    for i in range(fitness_list.shape[1]):
+        plt.plot(range(len(fitness_list))[1:], fitness_list[1:, i], label=f'subpopulation {i+1}')
     plt.title('Population structure')
     plt.xlabel('Generation')
     plt.ylabel('Frequency of allele A')
-    plt.legend()
+    if fitness_list.shape[1] <= 10:
+        plt.legend()
     plt.grid()
     plt.tight_layout()
     plt.savefig(f"population_structure_-m_{size}_{p}_{generations}.png")
@@ -5,15 +5,22 @@
 # @project: GPOP - Genetic Population
 
 import numpy as np
-from scipy.integrate import odeint
-import matplotlib.pyplot as plt
 import argparse
+from gpop import crossing_times
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--s', dest='s', type=float, required=True, help='affinity to the allele B')
-args = parser.parse_args() # parse the arguments
-
-s = args.s
+def get_parser() -> argparse.ArgumentParser:
+    '''
+    Get the parser of the arguments of the program
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--s', dest='s', type=float, default=None, help='affinity to the allele B')
+    parser.add_argument('--sweep', dest='sweep', type=float, nargs=3, default=None, metavar=('START', 'STOP', 'NUM'), help='integrate NUM values of s between START and STOP at once')
+    parser.add_argument('--thresholds', dest='thresholds', type=float, nargs='+', default=None, help='frequencies of the allele whose crossing times are returned instead of the figure')
+    parser.add_argument('--allele', dest='allele', type=int, default=0, help='index of the allele of the thresholds (0 for A, 1 for B)')
+    parser.add_argument('--stop', dest='stop', action='store_true', help='stop the integration at the crossing of the last threshold')
+    parser.add_argument('--points', dest='points', type=int, default=1000, help='number of time points of the sweep')
+    parser.add_argument('--no-plot', '--no_plot', dest='no_plot', action='store_true', help='do not draw nor save the figure')
+    return parser
 
 def Z2pop(Z, t, s) : # The function associated with the system
     z = sum(Z)
@@ -23,13 +30,76 @@ def Z2pop(Z, t, s) : # The function associated with the system
     ]
     return res
 
-def main():
+def Z2freq(t, x, s) : # The system for the frequency of the allele A, for a vector of selection coefficients
+    # With x = Z[0]/z, Z2pop gives dx/dt = x(1-x)((1 + (1+s)(1-x)) - ((1+s) + x)) = x(1-x)(1-(2+s)x)
+    return x*(1 - x)*(1 - (2 + s)*x)
+
+def sweep(s_values, t) :
+    '''
+    Integrate the system for many selection coefficients at once, as one vectorized system of frequencies
+    -----------------
+    parameters
+    s_values: np.ndarray -> the selection coefficients
+    t: np.ndarray -> the time points of the solution
+    -----------------
+    output
+    y: np.ndarray -> the frequency of the allele A for each selection coefficient at each time point, shape (s, t)
+    '''
+    from scipy.integrate import solve_ivp #scipy is only imported when a system is integrated
+    x0 = np.full(len(s_values), 0.5) # Initial frequencies, y0 = [1.0,1.0]
+    solution = solve_ivp(Z2freq, (t[0], t[-1]), x0, t_eval=t, args=(s_values,), rtol=1e-8, atol=1e-10)
+    return solution.y
+
+def main(argv : list = None):
+    '''
+    Integrate the system and plot the frequencies of the alleles
+    -----------------
+    parameter
+    argv: list -> the arguments of the program (those of the command line if None)
+    '''
+    parser = get_parser()
+    args = parser.parse_args(argv) # parse the arguments
+    if args.s is None and args.sweep is None:
+        parser.error('one of the arguments --s or --sweep is required')
+    s = args.s
+
+    if args.sweep is not None:
+        start, stop, num = args.sweep
+        s_values = np.linspace(start, stop, int(num)) # Selection coefficients of the sweep
+        t = np.linspace(0.0, 10.0, args.points) # Time points of the solution
+        y = sweep(s_values, t)
+        np.savez(f"selection_sweep_{start}_{stop}_{int(num)}.npz", s=s_values, t=t*100, frequencies=y)
+        if args.no_plot:
+            return
+
+        import matplotlib.pyplot as plt
+        plt.imshow(y, origin='lower', aspect='auto', extent=[0, max(t)*100, start, stop], vmin=0, vmax=1)
+        plt.colorbar(label="Frequency of the allele A")
+        plt.title("Evolution of the frequency of the allele A for each selection coefficient")
+        plt.xlabel("Time")
+        plt.ylabel("s")
+        plt.savefig(f"selection_sweep_{start}_{stop}_{int(num)}.png")
+        plt.show()
+        return
+
+    if args.thresholds is not None:
+        result = crossing_times(Z2pop, [1.0,1.0], 10.0, s, args.allele, args.thresholds, args.stop)
+        for threshold, time in zip(args.thresholds, result['times']):
+            print(f"The frequency of the allele {'AB'[args.allele]} crosses {threshold} at the time {time*100:g}")
+        print(f"At the time {result['t']*100:g}: Allele A: {round(result['y'][0],3)},    Allele B: {round(result['y'][1],3)} ({result['nfev']} evaluations of the system)")
+        return
+
     t = np.arange(0.0,10.0,0.001) # Time interval and time step for the integration of the system of ODEs
     y0 = [1.0,1.0] # Initial values of the system
 
+    from scipy.integrate import odeint #scipy is only imported when a system is integrated
     y = odeint(Z2pop, y0, t, args=(s,)) # Integration of the system of ODEs
     y = y/np.sum(y, axis=1)[:,None] # Normalization of the solution
+    if args.no_plot:
+        print(f"At the time {t[-1]*100:g}: Allele A: {round(y[-1,0],3)},    Allele B: {round(y[-1,1],3)}")
+        return
 
+    import matplotlib.pyplot as plt
     plt.plot(t*100,y[:,0], label = "Allele A", alpha = 0.8)
     plt.plot(t*100,y[:,1], label = "Allele B", alpha = 0.8)
     plt.title(f"Evolution of the allele frequencies in a population of 3 alleles\n Allele A: {round(y[-1,0],3)},    Allele B: {round(y[-1,1],3)}") 